@@ -0,0 +1,64 @@
+"""Benchmark of the import-time cold-start cost of the Lambda handlers.
+
+Imports every handler module in a fresh interpreter, a few times each, and reports the median import time and the
+heavy modules it loaded. Fails when a handler goes over its time budget or loads a module it must not need.
+
+    python -m benchmarks.cold_start_benchmark [runs]
+"""
+import json
+import statistics
+import subprocess
+import sys
+
+RUNS = 3
+HEAVY_MODULES = ("fitz", "nltk", "numpy", "sqlalchemy", "boto3", "requests")
+
+# handler module: (import time budget in ms, modules it must not load)
+HANDLER_BUDGETS = {
+    "routers.pdf_processor": (2500, ()),
+    "routers.meta_data_processor": (2000, ("fitz",)),
+    "routers.task_maker": (1200, ("fitz", "nltk")),
+    "routers.air_table_updater": (1200, ("fitz", "nltk")),
+    "routers.relief_web_scrubber": (1200, ("fitz", "nltk")),
+    "routers.reclassifier": (2500, ()),
+    "routers.create_ml_endpoint": (800, ("fitz", "nltk", "sqlalchemy")),
+    "routers.delete_ml_endpoint": (800, ("fitz", "nltk", "sqlalchemy")),
+}
+
+PROBE = """
+import importlib, json, sys, time
+start = time.perf_counter()
+importlib.import_module(sys.argv[1])
+elapsed = time.perf_counter() - start
+sys.stdout.write(json.dumps({"ms": elapsed * 1000, "modules": [m for m in sys.argv[2:] if m in sys.modules]}))
+"""
+
+
+def measure(handler: str, runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE, handler, *HEAVY_MODULES], capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(output))
+    return {"import_ms": round(statistics.median(s["ms"] for s in samples), 1), "heavy_modules": samples[0]["modules"]}
+
+
+def main() -> int:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else RUNS
+    results = {}
+    ok = True
+    for handler, (budget_ms, forbidden) in HANDLER_BUDGETS.items():
+        result = measure(handler, runs)
+        result["budget_ms"] = budget_ms
+        result["violations"] = [m for m in result["heavy_modules"] if m in forbidden]
+        if result["import_ms"] > budget_ms:
+            result["violations"].append("over budget")
+        ok = ok and not result["violations"]
+        results[handler] = result
+    sys.stdout.write(json.dumps(results, indent=2) + "\n")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
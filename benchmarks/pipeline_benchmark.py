@@ -0,0 +1,421 @@
+"""End-to-end throughput benchmark of the pipeline, with local stand-ins for every external service.
+
+Scrapes a synthetic ReliefWeb corpus, makes the processing tasks, processes the PDF and body-only documents and syncs
+them to Airtable. SQS, S3, SNS, Translate and the SageMaker runtime are in-process stubs, the SageMaker and Translate
+ones with a configurable latency, and a local HTTP server stands in for the ReliefWeb and Airtable APIs and serves the
+synthetic multi-page PDFs. Reports documents per minute, p50/p95 document latency, external calls per document and
+peak memory as JSON, and fails when a baseline report is given and a metric regressed by more than the tolerance.
+
+Needs a scratch Postgres database, which is wiped on every run, given by BENCHMARK_RDS_CONNECTION_URL.
+
+    python -m benchmarks.pipeline_benchmark [--documents 40] [--output report.json] [--baseline report.json]
+"""
+import argparse
+import io
+import json
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+import types
+import uuid
+from collections import Counter, defaultdict, deque
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List
+
+import fitz
+
+SQS_URL_PREFIX = "https://sqs.benchmark.local/000000000000/"
+# as in serverless.yml
+SQS_BATCH_SIZES = {"processing-documents-pdf": 4, "processing-documents-meta-data": 10}
+COUNTRIES = ["AFG", "SDN", "YEM", "HTI"]
+LANGUAGES = [("French", "fr"), ("Spanish", "es"), ("Arabic", "ar")]
+WORDS = (
+    "humanitarian access protection displaced population flood drought conflict assistance food security "
+    "shelter health water sanitation livelihoods response monitoring partners agencies reported district"
+).split()
+# metric: 1 when higher is better, -1 when lower is
+COMPARED_METRICS = {"docs_per_minute": 1, "latency_ms.p95": -1, "peak_rss_mb": -1}
+
+
+class CallCounter:
+    """Counts the calls made to the stand-ins, each of which may sleep for a latency."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Counter = Counter()
+
+    def add(self, service: str, latency_ms: float = 0.0) -> None:
+        with self._lock:
+            self.counts[service] += 1
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+
+
+calls = CallCounter()
+
+
+class StubSQS:
+    def __init__(self):
+        self.queues: dict = defaultdict(deque)
+
+    def send_message(self, QueueUrl: str, MessageBody: str, **kwargs) -> dict:
+        calls.add("sqs")
+        self.queues[QueueUrl.removeprefix(SQS_URL_PREFIX)].append(MessageBody)
+        return {"MessageId": str(uuid.uuid4())}
+
+    def send_message_batch(self, QueueUrl: str, Entries: List[dict]) -> dict:
+        calls.add("sqs")
+        self.queues[QueueUrl.removeprefix(SQS_URL_PREFIX)].extend(entry["MessageBody"] for entry in Entries)
+        return {"Successful": [{"Id": entry["Id"], "MessageId": str(uuid.uuid4())} for entry in Entries]}
+
+
+class StubS3:
+    def upload_fileobj(self, Fileobj, Bucket: str, Key: str, **kwargs) -> None:
+        calls.add("s3")
+        Fileobj.read()
+
+
+class StubSNS:
+    def publish(self, **kwargs) -> dict:
+        calls.add("sns")
+        return {"MessageId": str(uuid.uuid4())}
+
+
+class StubTranslate:
+    def __init__(self, latency_ms: float):
+        self.latency_ms = latency_ms
+
+    def translate_text(self, Text: str, SourceLanguageCode: str, TargetLanguageCode: str, **kwargs) -> dict:
+        calls.add("translate", self.latency_ms)
+        return {"TranslatedText": Text, "TargetLanguageCode": TargetLanguageCode}
+
+
+class StubSageMakerRuntime:
+    """Answers like the multi-model endpoint, with the scores of `classifier`."""
+
+    def __init__(self, latency_ms: float, classifier):
+        self.latency_ms = latency_ms
+        self.classifier = classifier
+
+    def invoke_endpoint(self, EndpointName: str, Body: str, TargetModel: str, **kwargs) -> dict:
+        calls.add("sagemaker", self.latency_ms)
+        scores = self.classifier.scores(TargetModel, json.loads(Body)["inputs"])
+        result = [[{"label": 0, "score": 1 - score}, {"label": 1, "score": score}] for score in scores]
+        return {"Body": io.BytesIO(json.dumps(result).encode())}
+
+
+def sentences(rnd: random.Random, count: int) -> str:
+    return " ".join(
+        " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(6, 18))).capitalize() + "." for _ in range(count)
+    )
+
+
+def synthetic_pdf(rnd: random.Random, page_count: int) -> bytes:
+    document = fitz.open()
+    for _ in range(page_count):
+        page = document.new_page()
+        # reports repeat a header on every page
+        page.insert_textbox(fitz.Rect(50, 30, 550, 60), "Humanitarian situation report, partners update.", fontsize=9)
+        y = 70
+        for _ in range(6):
+            page.insert_textbox(fitz.Rect(50, y, 550, y + 110), sentences(rnd, rnd.randint(2, 8)), fontsize=9)
+            y += 120
+    return document.tobytes()
+
+
+class Corpus:
+    """Synthetic ReliefWeb reports, created over the last hours, some with a PDF attachment and some not in English."""
+
+    def __init__(self, base_url: str, args: argparse.Namespace):
+        rnd = random.Random(args.seed)
+        start = datetime.now(tz=timezone.utc) - timedelta(hours=12)
+        self.reports: List[dict] = []
+        self.pdfs: dict = {}
+        for index in range(args.documents):
+            relief_web_id = 1_000_000 + index
+            created = (start + timedelta(seconds=index)).isoformat()
+            language, language_code = ("English", "en")
+            if rnd.random() < args.non_english_share:
+                language, language_code = rnd.choice(LANGUAGES)
+            country = rnd.choice(COUNTRIES)
+            fields = {
+                "date": {"created": created, "original": created},
+                "source": [{"name": "Benchmark"}],
+                "format": [{"name": "News and Press Release"}],
+                "title": sentences(rnd, 1),
+                "body": sentences(rnd, rnd.randint(20, 60)),
+                "url_alias": f"{base_url}/report/{relief_web_id}",
+                "language": [{"name": language, "code": language_code}],
+                "primary_country": {"iso3": country.lower()},
+                "country": [{"iso3": country.lower()}],
+            }
+            if rnd.random() < args.pdf_share:
+                self.pdfs[f"/pdf/{relief_web_id}.pdf"] = synthetic_pdf(rnd, args.pages)
+                fields["format"] = [{"name": "Situation Report"}]
+                fields["file"] = [{"url": f"{base_url}/pdf/{relief_web_id}.pdf"}]
+            self.reports.append({"id": relief_web_id, "fields": fields})
+
+
+class StubAPIHandler(BaseHTTPRequestHandler):
+    """ReliefWeb reports search under /reliefweb, Airtable tables under /airtable and the PDFs under /pdf."""
+
+    server: "StubAPIServer"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path.startswith("/pdf/"):
+            calls.add("pdf_download", self.server.latency_ms)
+            content = self.server.corpus.pdfs.get(self.path)
+            if content is None:
+                return self._send(404, b"")
+            return self._send(200, content, "application/pdf")
+        if self.path.startswith("/airtable/"):
+            calls.add("airtable", self.server.latency_ms)
+            return self._send_json({"records": [{"id": f"rec{iso3}", "fields": {"ISO3": iso3}} for iso3 in COUNTRIES]})
+        self._send(404, b"")
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path.startswith("/reliefweb/reports"):
+            calls.add("relief_web", self.server.latency_ms)
+            return self._send_json(self._search(body))
+        if self.path.startswith("/airtable/"):
+            calls.add("airtable", self.server.latency_ms)
+            return self._send_json(
+                {"records": [dict(record, id=f"rec{uuid.uuid4().hex}") for record in body["records"]]}
+            )
+        self._send(404, b"")
+
+    def _search(self, body: dict) -> dict:
+        date_range = body["filter"]["conditions"][0]["value"]
+        date_from = datetime.fromisoformat(date_range["from"])
+        date_to = datetime.fromisoformat(date_range["to"]) if "to" in date_range else None
+        matches = [
+            report
+            for report in self.server.corpus.reports
+            if date_from <= datetime.fromisoformat(report["fields"]["date"]["created"])
+            and (date_to is None or datetime.fromisoformat(report["fields"]["date"]["created"]) <= date_to)
+        ]
+        first, last = body["offset"], body["offset"] + body["limit"]
+        return {"totalCount": len(matches), "data": matches[first:last]}
+
+    def _send_json(self, content: dict) -> None:
+        self._send(200, json.dumps(content).encode(), "application/json")
+
+    def _send(self, status: int, content: bytes, content_type: str = "text/plain") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class StubAPIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    corpus: Corpus
+    latency_ms: float
+
+
+def percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return round(ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)], 1)
+
+
+def latency_summary(values: List[float]) -> dict:
+    return {"count": len(values), "p50": percentile(values, 50), "p95": percentile(values, 95)}
+
+
+def timed(handler: Callable[[dict], None], latencies: List[float]) -> Callable[[dict], None]:
+    def timed_handler(record: dict) -> None:
+        start = time.perf_counter()
+        try:
+            handler(record)
+        finally:
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    return timed_handler
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def configure_environment(base_url: str, args: argparse.Namespace) -> None:
+    # set before the project modules are imported, as the settings are read at import time
+    os.environ["RDS_CONNECTION_URL"] = os.environ["BENCHMARK_RDS_CONNECTION_URL"]
+    os.environ["RELIEF_WEB_API_URL"] = f"{base_url}/reliefweb"
+    os.environ["AIR_TABLE_API_URL"] = f"{base_url}/airtable"
+    os.environ["AIR_TABLE_APP_ID"] = "appBenchmark"
+    os.environ["AIR_TABLE_API_KEY"] = "benchmark"
+    os.environ["RESOURCES_URL_PREFIX"] = SQS_URL_PREFIX
+    os.environ["CLASSIFIER_BACKEND"] = "sagemaker"
+    os.environ["DAY_PROCESSING_LIMIT"] = str(args.documents)
+    os.environ.setdefault("AWS_DEFAULT_REGION", "eu-central-1")
+
+
+def run(args: argparse.Namespace) -> dict:
+    server = StubAPIServer(("127.0.0.1", 0), StubAPIHandler)
+    server.latency_ms = args.api_latency_ms
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    server.corpus = Corpus(base_url, args)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    configure_environment(base_url, args)
+
+    from sqlalchemy import func, select, text
+
+    import models.classification_cache  # noqa: F401
+    import models.country  # noqa: F401
+    import models.scraper_watermark  # noqa: F401
+    import models.translation  # noqa: F401
+    from infrastructure.aws import process_sqs_batch
+    from infrastructure.aws_clients import register_client
+    from infrastructure.classifier import FakeClassifier
+    from infrastructure.config import SQS_BATCH_WORKERS
+    from infrastructure.db import Base, Session, db_stats, engine
+    from models.document import Document
+    from routers import air_table_updater, meta_data_processor, pdf_processor, relief_web_scrubber, task_maker
+
+    sqs = StubSQS()
+    register_client("sqs", sqs)
+    register_client("s3", StubS3())
+    register_client("sns", StubSNS())
+    register_client("translate", StubTranslate(args.translate_latency_ms))
+    register_client("sagemaker-runtime", StubSageMakerRuntime(args.sagemaker_latency_ms, FakeClassifier()))
+
+    Base.metadata.create_all(engine)
+    tables = ", ".join(f'"{table.name}"' for table in Base.metadata.sorted_tables)
+    with engine.begin() as connection:
+        connection.execute(text(f"TRUNCATE {tables} CASCADE"))
+
+    context = types.SimpleNamespace(function_name="pipeline_benchmark")
+    stage_seconds = {}
+    latencies: dict = {"pdf": [], "body": []}
+    run_start = time.perf_counter()
+
+    start = time.perf_counter()
+    relief_web_scrubber.run({}, context)
+    stage_seconds["scrape"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    task_maker.run({}, context)
+    stage_seconds["task_making"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    start_db = db_stats.snapshot()
+    # as Lambda feeds the processors, one batch at a time per queue; process_sqs_batch is what their run() does
+    for queue_name, router, kind in (
+        ("processing-documents-pdf", pdf_processor, "pdf"),
+        ("processing-documents-meta-data", meta_data_processor, "body"),
+    ):
+        queue = sqs.queues[queue_name]
+        while queue:
+            batch = [queue.popleft() for _ in range(min(SQS_BATCH_SIZES[queue_name], len(queue)))]
+            event = {"Records": [{"messageId": str(uuid.uuid4()), "body": body} for body in batch]}
+            process_sqs_batch(event, timed(router.process_record, latencies[kind]), SQS_BATCH_WORKERS)
+    end_db = db_stats.snapshot()
+    stage_seconds["processing"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    air_table_updater.run({}, context)
+    stage_seconds["air_table_sync"] = time.perf_counter() - start
+    total_seconds = time.perf_counter() - run_start
+    server.shutdown()
+
+    with Session.session_factory() as session:
+        counts = session.execute(
+            select(
+                func.count(),
+                func.count().filter(Document.processed.is_(True)),
+                func.count().filter(Document.failed.is_(True)),
+                func.count().filter(Document.synchronized.is_(True)),
+            )
+        ).one()
+    processed = len(latencies["pdf"]) + len(latencies["body"])
+    return {
+        "commit": git_commit(),
+        "date": datetime.now(tz=timezone.utc).isoformat(),
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "documents": dict(zip(("scraped", "processed", "failed", "synchronized"), counts)),
+        "stage_seconds": {stage: round(seconds, 2) for stage, seconds in stage_seconds.items()},
+        "docs_per_minute": round(processed / stage_seconds["processing"] * 60, 1) if processed else 0.0,
+        "end_to_end_docs_per_minute": round(processed / total_seconds * 60, 1) if processed else 0.0,
+        "latency_ms": {
+            **latency_summary(latencies["pdf"] + latencies["body"]),
+            "pdf": latency_summary(latencies["pdf"]),
+            "body": latency_summary(latencies["body"]),
+        },
+        "calls_per_document": {
+            service: round(count / max(processed, 1), 2) for service, count in sorted(calls.counts.items())
+        },
+        "db_queries_per_document": round((end_db["queries"] - start_db["queries"]) / max(processed, 1), 1),
+        # ru_maxrss is reported in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def metric(report: dict, name: str) -> float:
+    value = report
+    for key in name.split("."):
+        value = value[key]
+    return value
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> dict:
+    comparison = {}
+    for name, direction in COMPARED_METRICS.items():
+        current, previous = metric(report, name), metric(baseline, name)
+        change = current / previous - 1 if previous else 0.0
+        comparison[name] = {
+            "baseline": previous,
+            "current": current,
+            "change": round(change, 3),
+            "regression": direction * change < -tolerance,
+        }
+    return {"baseline_commit": baseline.get("commit", ""), "metrics": comparison}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=40)
+    parser.add_argument("--pages", type=int, default=5, help="pages per synthetic PDF")
+    parser.add_argument("--pdf-share", type=float, default=0.6)
+    parser.add_argument("--non-english-share", type=float, default=0.3)
+    parser.add_argument("--sagemaker-latency-ms", type=float, default=50)
+    parser.add_argument("--translate-latency-ms", type=float, default=30)
+    parser.add_argument("--api-latency-ms", type=float, default=20, help="of the ReliefWeb, Airtable and PDF stubs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="file to save the report to")
+    parser.add_argument("--baseline", help="report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative change counted as a regression")
+    args = parser.parse_args()
+    if "BENCHMARK_RDS_CONNECTION_URL" not in os.environ:
+        parser.error("BENCHMARK_RDS_CONNECTION_URL must point to a scratch Postgres database, it is wiped")
+
+    report = run(args)
+    ok = True
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            report["comparison"] = compare(report, json.load(baseline_file), args.tolerance)
+        ok = not any(result["regression"] for result in report["comparison"]["metrics"].values())
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    sys.stdout.write(json.dumps(report, indent=2) + "\n")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
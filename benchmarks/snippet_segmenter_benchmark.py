@@ -0,0 +1,91 @@
+"""Micro-benchmark of snippet segmentation on long synthetic DocumentText bodies.
+
+Compares SnippetSegmenter with the former loop, which re-tokenized the growing snippet at every sentence,
+and fails when the segmenter time stops growing linearly with the body length.
+
+    python -m benchmarks.snippet_segmenter_benchmark
+"""
+import json
+import random
+import sys
+import time
+
+from nltk.tokenize import word_tokenize
+
+from infrastructure.tokenizer import sent_tokenize
+from services.snippet_segmenter import SnippetSegmenter
+
+MIN_TEXT_BLOCK = 20
+MAX_SNIPED_SIZE = 80
+SENTENCE_COUNTS = [250, 500, 1000, 2000]
+# allowed growth of the per-sentence time between the smallest and the largest body
+LINEARITY_TOLERANCE = 2.0
+
+WORDS = (
+    "humanitarian access protection displaced population flood drought conflict assistance food security "
+    "shelter health water sanitation livelihoods response monitoring partners agencies reported district"
+).split()
+
+
+def synthetic_body(sentence_count: int, seed: int = 0) -> str:
+    rnd = random.Random(seed)
+    sentences = []
+    for _ in range(sentence_count):
+        # mostly short sentences with a few over-long ones, as in real reports
+        length = rnd.choice([8, 12, 15, 20, 25, 30, 90])
+        sentences.append(" ".join(rnd.choice(WORDS) for _ in range(length)).capitalize() + ".")
+    return " ".join(sentences)
+
+
+def legacy_segment(sentences):
+    processed_sent_count = 0
+    sniped = ""
+    while processed_sent_count < len(sentences):
+        cur_sent = sentences[processed_sent_count]
+        if len(word_tokenize(sniped)) + len(word_tokenize(cur_sent)) <= MAX_SNIPED_SIZE:
+            sniped += f" {cur_sent}"
+            processed_sent_count += 1
+        elif not sniped and len(word_tokenize(cur_sent)) > MAX_SNIPED_SIZE:
+            sniped += f" {cur_sent}"
+            processed_sent_count += 1
+        else:
+            yield sniped
+            sniped = ""
+    if len(word_tokenize(sniped)) >= MIN_TEXT_BLOCK:
+        yield sniped
+
+
+def timed(func, *args) -> tuple:
+    start = time.perf_counter()
+    res = list(func(*args))
+    return time.perf_counter() - start, res
+
+
+def main() -> int:
+    segmenter = SnippetSegmenter(MIN_TEXT_BLOCK, MAX_SNIPED_SIZE)
+
+    results = []
+    for sentence_count in SENTENCE_COUNTS:
+        sentences = sent_tokenize(synthetic_body(sentence_count))
+        segmenter_time, snipeds = timed(lambda s: segmenter.segment(segmenter.measure(s)), sentences)
+        legacy_time, legacy_snipeds = timed(legacy_segment, sentences)
+        results.append(
+            {
+                "sentences": len(sentences),
+                "snippets": len(snipeds),
+                "same_snippets": snipeds == legacy_snipeds,
+                "segmenter_s": round(segmenter_time, 4),
+                "legacy_s": round(legacy_time, 4),
+                "segmenter_us_per_sentence": round(segmenter_time / len(sentences) * 1e6, 2),
+            }
+        )
+        sys.stdout.write(json.dumps(results[-1]) + "\n")
+
+    growth = results[-1]["segmenter_us_per_sentence"] / results[0]["segmenter_us_per_sentence"]
+    linear = growth <= LINEARITY_TOLERANCE
+    sys.stdout.write(f"per-sentence time growth: {growth:.2f}x ({'linear' if linear else 'NOT linear'})\n")
+    return 0 if linear and all(res["same_snippets"] for res in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
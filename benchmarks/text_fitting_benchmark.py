@@ -0,0 +1,106 @@
+"""Benchmark of font-size fitting when re-typesetting dense pages.
+
+Builds a multi-page fixture PDF with small-print text blocks, then re-typesets every block starting from 11pt,
+once with the former 0.1pt decrement loop and once with TextFitter, and reports time per page and layout attempts.
+
+    python -m benchmarks.text_fitting_benchmark
+"""
+import json
+import random
+import sys
+import time
+
+import fitz
+
+from services.text_fitter import TextFitter
+
+PAGE_COUNT = 10
+BLOCKS_PER_PAGE = 12
+START_FONT_SIZE = 11.0
+
+WORDS = (
+    "humanitarian access protection displaced population flood drought conflict assistance food security "
+    "shelter health water sanitation livelihoods response monitoring partners agencies reported district"
+).split()
+
+
+def fixture_pdf(seed: int = 0):
+    rnd = random.Random(seed)
+    document = fitz.open()
+    for _ in range(PAGE_COUNT):
+        page = document.new_page()
+        y = 30
+        for _ in range(BLOCKS_PER_PAGE):
+            text = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(60, 110)))
+            page.insert_textbox(fitz.Rect(40, y, 560, y + 62), text, fontsize=6.5)
+            y += 64
+    return fitz.open("pdf", document.tobytes())
+
+
+def page_blocks(document) -> list:
+    pages = []
+    for page in document:
+        blocks = []
+        for block in page.get_text("dict")["blocks"]:
+            if block["type"] == 0:
+                text = " ".join("".join(span["text"] for span in line["spans"]) for line in block["lines"])
+                blocks.append((fitz.Rect(block["bbox"]), text))
+        pages.append(blocks)
+    return pages
+
+
+def render_legacy(pages: list) -> tuple:
+    output = fitz.open()
+    attempts = 0
+    for blocks in pages:
+        shape = output.new_page().new_shape()
+        for rect, text in blocks:
+            font_size = START_FONT_SIZE
+            rc = -1
+            while font_size > 0 and rc < 0:
+                attempts += 1
+                rc = shape.insert_textbox(rect, text, fontsize=font_size, lineheight=1)
+                font_size -= 0.1
+        shape.commit()
+    return output, attempts
+
+
+def render_fitted(pages: list) -> tuple:
+    output = fitz.open()
+    fitter = TextFitter()
+    for blocks in pages:
+        shape = output.new_page().new_shape()
+        for rect, text in blocks:
+            font_size = fitter.fit(rect, text, START_FONT_SIZE, lineheight=1)
+            if font_size:
+                shape.insert_textbox(rect, text, fontsize=font_size, lineheight=1)
+        shape.commit()
+    return output, fitter.attempts
+
+
+def timed(func, *args) -> tuple:
+    start = time.perf_counter()
+    res = func(*args)
+    return time.perf_counter() - start, res
+
+
+def main() -> int:
+    pages = page_blocks(fixture_pdf())
+    legacy_time, (legacy_output, legacy_attempts) = timed(render_legacy, pages)
+    fitted_time, (fitted_output, fitted_attempts) = timed(render_fitted, pages)
+    same_text = all(a.get_text() == b.get_text() for a, b in zip(legacy_output, fitted_output))
+    result = {
+        "pages": len(pages),
+        "blocks": sum(len(blocks) for blocks in pages),
+        "legacy_ms_per_page": round(legacy_time / len(pages) * 1000, 2),
+        "fitted_ms_per_page": round(fitted_time / len(pages) * 1000, 2),
+        "legacy_layout_attempts": legacy_attempts,
+        "fitted_layout_attempts": fitted_attempts,
+        "same_text": same_text,
+    }
+    sys.stdout.write(json.dumps(result) + "\n")
+    return 0 if same_text and fitted_time < legacy_time else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,74 +1,168 @@
-import json
 import logging
+import threading
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional
 
-import boto3
+from infrastructure import metrics
+from infrastructure.classifier import get_classifier
+from infrastructure.classification_cache import get_classification_cache, snippet_cache_key
 from infrastructure.config import (
     RESOURCES_URL_PREFIX,
     PREDICTION_ENDPOINT_NAME,
     MODEL_NAME,
     ENDPOINT_CONFIG_NAME,
     SEND_EMAIL_TOPIC,
+    TRANSLATE_MAX_CONCURRENCY,
+    CLASSIFICATION_THRESHOLD,
 )
+from infrastructure.aws_clients import get_client
+from infrastructure.utils import chunked
 
 # Adding a comment for commmit
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-runtime_sm_client = boto3.client(service_name="sagemaker-runtime")
-sm_client = boto3.client("sagemaker")
-
-
-def predict_classes(text, threshold=0.9):
+# Process-wide limit on in-flight requests, shared by all threads of a container.
+translate_throttle = threading.BoundedSemaphore(TRANSLATE_MAX_CONCURRENCY)
+
+
+MODELS = [
+    "model-Access.tar.gz",
+    "model-InformL.tar.gz",
+    "model-Protection.tar.gz",
+    "model-Seasonal.tar.gz",
+]
+LABELS = [f"tag_{model_name[6:-7]}" for model_name in MODELS]
+SQS_BATCH_MAX_COUNT = 10
+SQS_SEND_ATTEMPTS = 3
+SQS_RETRY_BACKOFF = 0.2
+
+
+def _model_scores(model_name: str, texts: List[str]) -> List[float]:
+    classifier = get_classifier()
+    cache = get_classification_cache() if classifier.CACHEABLE else None
+    if cache is None:
+        return classifier.scores(model_name, texts)
+
+    keys = [snippet_cache_key(text, model_name) for text in texts]
+    texts_by_key = dict(zip(keys, texts))
+    scores = cache.get_many(list(texts_by_key))
+    missed = {key: text for key, text in texts_by_key.items() if key not in scores}
+    if missed:
+        new_scores = dict(zip(missed.keys(), classifier.scores(model_name, list(missed.values()))))
+        cache.set_many(new_scores)
+        scores.update(new_scores)
+    return [scores[key] for key in keys]
+
+
+def predict_scores_batch(texts: List[str]) -> List[Optional[List[float]]]:
+    """Score snippets with every model at once, returning the scores of each snippet in MODELS order, or None for
+    every snippet when the endpoint failed."""
+    if not texts:
+        return []
     try:
-        # Format the input
-        models = [
-            "model-Access.tar.gz",
-            "model-InformL.tar.gz",
-            "model-Protection.tar.gz",
-            "model-Seasonal.tar.gz",
-        ]
-        payload = {"inputs": text, "parameters": {"return_all_scores": True}}
-        predicted_classes = []
-        # Send text via InvokeEndpoint API
-        label_names = [f"tag_{model_name[6:-7]}" for model_name in models]
-
-        for ind, model_name in enumerate(models):
-            response = runtime_sm_client.invoke_endpoint(
-                EndpointName=PREDICTION_ENDPOINT_NAME,
-                ContentType="application/json",
-                TargetModel=model_name,
-                Body=json.dumps(payload),
+        with metrics.span("classify"), ThreadPoolExecutor(max_workers=len(MODELS)) as executor:
+            results = list(
+                executor.map(metrics.in_context(lambda model_name: _model_scores(model_name, texts)), MODELS)
             )
-            result = json.loads(response["Body"].read().decode())
-            predicted_classes.extend(
-                [label_names[ind] for item in result[0] if item["score"] >= threshold and item["label"] == 1]
-            )
-
     except Exception:
         logger.error(traceback.format_exc())
-        predicted_classes = []
+        return [None for _ in texts]
+    return [list(text_scores) for text_scores in zip(*results)]
 
-    return predicted_classes
 
+def labels_from_scores(scores: Optional[List[float]], threshold: float = CLASSIFICATION_THRESHOLD) -> List[str]:
+    if not scores:
+        return []
+    return [label for label, score in zip(LABELS, scores) if score >= threshold]
+
+
+def predict_classes_batch(texts: List[str], threshold=CLASSIFICATION_THRESHOLD) -> List[List[str]]:
+    """Classify snippets with every model at once, returning the labels of each snippet in input order."""
+    return [labels_from_scores(scores, threshold) for scores in predict_scores_batch(texts)]
 
-def send_to_sqs(topic_name: str, message: str) -> None:
-    sqs = boto3.client("sqs")
 
+def predict_classes(text, threshold=CLASSIFICATION_THRESHOLD):
+    return predict_classes_batch([text], threshold)[0]
+
+
+def get_sqs():
+    return get_client("sqs")
+
+
+def send_to_sqs(topic_name: str, message: str) -> None:
     # queue = sqs.get_queue_by_name(QueueName=f"{RESOURCES_URL_PREFIX}{topic_name}")
 
-    sqs.send_message(QueueUrl=f"{RESOURCES_URL_PREFIX}{topic_name}", MessageBody=message)
+    metrics.count("sqs")
+    get_sqs().send_message(QueueUrl=f"{RESOURCES_URL_PREFIX}{topic_name}", MessageBody=message)
+
+
+def send_batch_to_sqs(topic_name: str, messages: Iterable[str]) -> List[str]:
+    """Send the messages in batches of SQS_BATCH_MAX_COUNT, retrying only the entries SQS failed to enqueue.
+
+    Return the messages which could not be sent.
+    """
+    sqs = get_sqs()
+    queue_url = f"{RESOURCES_URL_PREFIX}{topic_name}"
+    undelivered = []
+    for batch in chunked(messages, SQS_BATCH_MAX_COUNT):
+        entries = [{"Id": str(ind), "MessageBody": message} for ind, message in enumerate(batch)]
+        for attempt in range(SQS_SEND_ATTEMPTS):
+            if attempt:
+                time.sleep(SQS_RETRY_BACKOFF * 2 ** (attempt - 1))
+            metrics.count("sqs")
+            failed = {
+                entry["Id"]: entry
+                for entry in sqs.send_message_batch(QueueUrl=queue_url, Entries=entries).get("Failed", [])
+            }
+            if failed:
+                logger.warning(
+                    f"{len(failed)} of {len(entries)} messages to {topic_name} failed: {list(failed.values())}"
+                )
+            retry_entries = []
+            for entry in entries:
+                if entry["Id"] not in failed:
+                    continue
+                # sender faults, such as a malformed message, fail again on retry
+                if failed[entry["Id"]].get("SenderFault"):
+                    undelivered.append(entry["MessageBody"])
+                else:
+                    retry_entries.append(entry)
+            entries = retry_entries
+            if not entries:
+                break
+        undelivered.extend(entry["MessageBody"] for entry in entries)
+    return undelivered
+
+
+def process_sqs_batch(event: dict, handler: Callable[[dict], None], max_workers: int) -> dict:
+    """Run `handler` on the records of an SQS event, `max_workers` at a time, and return the partial batch
+    response, so that only the messages which failed are redelivered."""
+    records = event.get("Records", [])
+    failures = []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(records)))) as executor:
+        futures = [(record, executor.submit(handler, record)) for record in records]
+        for record, future in futures:
+            try:
+                future.result()
+            except Exception:
+                logger.error(f"Message {record['messageId']} failed: {traceback.format_exc()}")
+                failures.append({"itemIdentifier": record["messageId"]})
+    return {"batchItemFailures": failures}
 
 
 def get_s3():
-    return boto3.client("s3")
+    return get_client("s3")
 
 
 def get_translation_service():
-    return boto3.client("translate")
+    return get_client("translate")
 
 
 def create_ml_endpoint():
+    sm_client = get_client("sagemaker")
     # create endpoint config
     response = sm_client.create_endpoint_config(
         EndpointConfigName=ENDPOINT_CONFIG_NAME,
@@ -87,11 +181,13 @@ def create_ml_endpoint():
 
 
 def delete_ml_endpoint():
+    sm_client = get_client("sagemaker")
     endpoint_del = sm_client.delete_endpoint(EndpointName=PREDICTION_ENDPOINT_NAME)
     endpoint_config_del = sm_client.delete_endpoint_config(EndpointConfigName=ENDPOINT_CONFIG_NAME)
     return endpoint_del, endpoint_config_del
 
 
 def send_email(message: str) -> None:
-    sns = boto3.client("sns")
+    sns = get_client("sns")
+    metrics.count("sns")
     sns.publish(TopicArn=str(SEND_EMAIL_TOPIC), Message=message)
@@ -0,0 +1,74 @@
+import logging
+import threading
+import time
+from typing import Any, Dict
+
+import boto3
+from botocore.config import Config
+
+from infrastructure import metrics
+from infrastructure.config import (
+    AWS_MAX_ATTEMPTS,
+    AWS_CONNECT_TIMEOUT,
+    AWS_READ_TIMEOUT,
+    SAGEMAKER_MAX_CONCURRENCY,
+    TRANSLATE_MAX_CONCURRENCY,
+    SQS_ENDPOINT_URL,
+)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def _config(max_pool_connections: int = 10, read_timeout: float = AWS_READ_TIMEOUT) -> Config:
+    return Config(
+        max_pool_connections=max_pool_connections,
+        retries={"mode": "adaptive", "total_max_attempts": AWS_MAX_ATTEMPTS},
+        connect_timeout=AWS_CONNECT_TIMEOUT,
+        read_timeout=read_timeout,
+    )
+
+
+# Pools are sized after the number of threads which may use a client at once.
+CLIENT_CONFIGS: Dict[str, Config] = {
+    "sagemaker-runtime": _config(SAGEMAKER_MAX_CONCURRENCY),
+    "translate": _config(TRANSLATE_MAX_CONCURRENCY),
+    "s3": _config(read_timeout=120),
+}
+DEFAULT_CLIENT_CONFIG = _config()
+ENDPOINT_URLS: Dict[str, str] = {"sqs": SQS_ENDPOINT_URL} if SQS_ENDPOINT_URL else {}
+
+_clients: Dict[str, Any] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(service_name: str):
+    """Return the client of `service_name`, created on first use and kept for warm invocations.
+
+    boto3 clients are thread-safe, so one client and its connection pool is shared by all threads.
+    """
+    with _clients_lock:
+        if service_name in _clients:
+            client = _clients[service_name]
+            created_ms = None
+        else:
+            start = time.perf_counter()
+            client = boto3.client(
+                service_name,
+                config=CLIENT_CONFIGS.get(service_name, DEFAULT_CLIENT_CONFIG),
+                endpoint_url=ENDPOINT_URLS.get(service_name),
+            )
+            created_ms = (time.perf_counter() - start) * 1000
+            _clients[service_name] = client
+    # the trace gets the clients created and reused by its own unit of work
+    if created_ms is None:
+        metrics.add("aws_clients", **{f"{service_name}_reuses": 1})
+    else:
+        metrics.add("aws_clients", **{f"{service_name}_creation_ms": created_ms})
+    return client
+
+
+def register_client(service_name: str, client) -> None:
+    """Use `client` for `service_name` from now on, e.g. a stub in benchmarks."""
+    with _clients_lock:
+        _clients[service_name] = client
@@ -0,0 +1,176 @@
+import logging
+import threading
+import time
+import traceback
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from infrastructure import metrics
+from infrastructure.config import (
+    CLASSIFICATION_CACHE_BACKEND,
+    CLASSIFICATION_CACHE_TTL,
+    CLASSIFICATION_CACHE_MAX_SIZE,
+)
+from infrastructure.utils import normalized_text_hash
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def snippet_cache_key(text: str, model_name: str) -> str:
+    # scores are cached raw, so one entry serves any threshold
+    return f"{normalized_text_hash(text)}:{model_name}"
+
+
+class ClassificationCache(ABC):
+    """Content-addressed store of model scores, keyed by snippet_cache_key. Backend errors are logged and taken as
+    misses or skipped writes, so the cache never stops classification."""
+
+    def __init__(self, max_size: int = CLASSIFICATION_CACHE_MAX_SIZE, ttl: int = CLASSIFICATION_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+
+    def get_many(self, keys: List[str]) -> Dict[str, float]:
+        try:
+            found = self._get_many(keys)
+        except Exception:
+            logger.error(traceback.format_exc())
+            found = {}
+        metrics.add("classification_cache", hits=len(found), misses=len(keys) - len(found))
+        return found
+
+    def set_many(self, scores: Dict[str, float]) -> None:
+        if scores:
+            try:
+                self._set_many(scores)
+            except Exception:
+                logger.error(traceback.format_exc())
+
+    @abstractmethod
+    def _get_many(self, keys: List[str]) -> Dict[str, float]:
+        pass
+
+    @abstractmethod
+    def _set_many(self, scores: Dict[str, float]) -> None:
+        pass
+
+
+class MemoryClassificationCache(ClassificationCache):
+    """In-process LRU cache, shared by all invocations of a warm container."""
+
+    def __init__(self, max_size: int = CLASSIFICATION_CACHE_MAX_SIZE, ttl: int = CLASSIFICATION_CACHE_TTL):
+        super().__init__(max_size, ttl)
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_many(self, keys: List[str]) -> Dict[str, float]:
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                expires_at, score = entry
+                if expires_at < now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = score
+        return found
+
+    def _set_many(self, scores: Dict[str, float]) -> None:
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for key, score in scores.items():
+                self._entries[key] = (expires_at, score)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+class PostgresClassificationCache(ClassificationCache):
+    """Cache shared between containers, stored in the classification_cache table."""
+
+    EVICTION_INTERVAL = 5 * 60
+
+    def __init__(self, max_size: int = CLASSIFICATION_CACHE_MAX_SIZE, ttl: int = CLASSIFICATION_CACHE_TTL):
+        super().__init__(max_size, ttl)
+        self._last_eviction = 0.0
+
+    @staticmethod
+    def _new_session():
+        # Imported here so that handlers which never classify do not pay for the database setup.
+        from infrastructure.db import Session
+
+        # A separate session keeps cache writes out of the caller's unit of work.
+        return Session.session_factory()
+
+    def _get_many(self, keys: List[str]) -> Dict[str, float]:
+        from sqlalchemy import select
+        from models.classification_cache import ClassificationCacheEntry
+
+        min_date = datetime.now(tz=timezone.utc) - timedelta(seconds=self.ttl)
+        with self._new_session() as session:
+            res = session.execute(
+                select(ClassificationCacheEntry.key, ClassificationCacheEntry.score).filter(
+                    ClassificationCacheEntry.key.in_(keys), ClassificationCacheEntry.date_created >= min_date
+                )
+            )
+            return {key: score for key, score in res}
+
+    def _set_many(self, scores: Dict[str, float]) -> None:
+        from sqlalchemy.dialects.postgresql import insert
+        from models.classification_cache import ClassificationCacheEntry
+
+        now = datetime.now(tz=timezone.utc)
+        stmt = insert(ClassificationCacheEntry).values(
+            [dict(key=key, score=score, date_created=now) for key, score in scores.items()]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ClassificationCacheEntry.key],
+            set_=dict(score=stmt.excluded.score, date_created=stmt.excluded.date_created),
+        )
+        with self._new_session() as session:
+            session.execute(stmt)
+            session.commit()
+
+        if time.monotonic() - self._last_eviction > self.EVICTION_INTERVAL:
+            self.evict()
+
+    def evict(self) -> None:
+        from sqlalchemy import delete, select
+        from models.classification_cache import ClassificationCacheEntry
+
+        self._last_eviction = time.monotonic()
+        min_date = datetime.now(tz=timezone.utc) - timedelta(seconds=self.ttl)
+        newest_keys = (
+            select(ClassificationCacheEntry.key)
+            .order_by(ClassificationCacheEntry.date_created.desc())
+            .limit(self.max_size)
+            .scalar_subquery()
+        )
+        with self._new_session() as session:
+            session.execute(delete(ClassificationCacheEntry).filter(ClassificationCacheEntry.date_created < min_date))
+            session.execute(
+                delete(ClassificationCacheEntry).filter(ClassificationCacheEntry.key.not_in(newest_keys)),
+                execution_options={"synchronize_session": False},
+            )
+            session.commit()
+
+
+_classification_cache: Optional[ClassificationCache] = None
+
+
+def get_classification_cache() -> Optional[ClassificationCache]:
+    global _classification_cache
+    if _classification_cache is None:
+        if CLASSIFICATION_CACHE_BACKEND == "memory":
+            _classification_cache = MemoryClassificationCache()
+        elif CLASSIFICATION_CACHE_BACKEND == "postgres":
+            _classification_cache = PostgresClassificationCache()
+        elif CLASSIFICATION_CACHE_BACKEND != "none":
+            logger.error(f"Unknown classification cache backend: {CLASSIFICATION_CACHE_BACKEND}")
+    return _classification_cache
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+from infrastructure import metrics
+from infrastructure.aws_clients import get_client
+from infrastructure.config import (
+    CLASSIFIER_BACKEND,
+    CLASSIFIER_BATCH_SIZE,
+    CLASSIFIER_MODEL_DIR,
+    CLASSIFIER_MODEL_S3_URI,
+    CLASSIFIER_THREADS,
+    PREDICTION_ENDPOINT_NAME,
+    SAGEMAKER_MAX_CONCURRENCY,
+)
+from infrastructure.utils import normalized_text_hash
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Process-wide limit on in-flight endpoint requests, shared by all threads of a container.
+sagemaker_throttle = threading.BoundedSemaphore(SAGEMAKER_MAX_CONCURRENCY)
+
+
+class ClassifierBackend(ABC):
+    """Scores snippets with the framework models, a score being the probability of the positive class."""
+
+    # whether scores may go to the classification cache, i.e. come from the real models
+    CACHEABLE = True
+
+    @abstractmethod
+    def scores(self, model_name: str, texts: List[str]) -> List[float]:
+        pass
+
+
+class SageMakerClassifier(ClassifierBackend):
+    """Scores with the multi-model endpoint, which only runs while create_ml_endpoint has it up."""
+
+    BATCH_SIZE = 32
+
+    def scores(self, model_name: str, texts: List[str]) -> List[float]:
+        scores = []
+        for start in range(0, len(texts), self.BATCH_SIZE):
+            end = start + self.BATCH_SIZE
+            payload = {"inputs": texts[start:end], "parameters": {"return_all_scores": True}}
+            with sagemaker_throttle:
+                result = self._invoke(model_name, payload)
+            scores.extend(
+                max((item["score"] for item in text_scores if item["label"] == 1), default=0.0)
+                for text_scores in result
+            )
+        return scores
+
+    @staticmethod
+    def _invoke(model_name: str, payload: dict) -> list:
+        metrics.count("sagemaker")
+        response = get_client("sagemaker-runtime").invoke_endpoint(
+            EndpointName=PREDICTION_ENDPOINT_NAME,
+            ContentType="application/json",
+            TargetModel=model_name,
+            Body=json.dumps(payload),
+        )
+        return json.loads(response["Body"].read().decode())
+
+
+class LocalClassifier(ClassifierBackend):
+    """Runs the models in process on the CPU, from the model-*.tar.gz artifacts the endpoint serves.
+
+    Archives are read from CLASSIFIER_MODEL_DIR, or first fetched there from CLASSIFIER_MODEL_S3_URI, and each model
+    is loaded once per container. Batches run one at a time with CLASSIFIER_THREADS torch threads, so the threads of a
+    document never compete for the cores. Needs torch and transformers, from requirements-local.txt.
+    """
+
+    MAX_LENGTH = 512
+
+    def __init__(self, model_dir: str = CLASSIFIER_MODEL_DIR, threads: int = CLASSIFIER_THREADS):
+        self.model_dir = model_dir
+        self.threads = threads
+        self._models: Dict[str, tuple] = {}
+        self._load_lock = threading.Lock()
+        self._inference_lock = threading.Lock()
+
+    def scores(self, model_name: str, texts: List[str]) -> List[float]:
+        import torch
+
+        tokenizer, model = self._get_model(model_name)
+        scores: List[float] = []
+        for start in range(0, len(texts), CLASSIFIER_BATCH_SIZE):
+            end = start + CLASSIFIER_BATCH_SIZE
+            inputs = tokenizer(
+                texts[start:end],
+                padding=True,
+                truncation=True,
+                max_length=self.MAX_LENGTH,
+                return_tensors="pt",
+            )
+            with self._inference_lock, torch.inference_mode():
+                probabilities = torch.softmax(model(**inputs).logits, dim=-1)
+            # the endpoint reports the score of label 1
+            scores.extend(probabilities[:, 1].tolist())
+        return scores
+
+    def _get_model(self, model_name: str) -> tuple:
+        with self._load_lock:
+            if model_name not in self._models:
+                self._models[model_name] = self._load(model_name)
+            return self._models[model_name]
+
+    def _load(self, model_name: str) -> tuple:
+        # Imported here so that the other backends never pay for them.
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        torch.set_num_threads(self.threads)
+        path = self._extract(model_name)
+        tokenizer = AutoTokenizer.from_pretrained(path)
+        model = AutoModelForSequenceClassification.from_pretrained(path).eval()
+        logger.info(f"Loaded {model_name} from {path}")
+        return tokenizer, model
+
+    def _extract(self, model_name: str) -> str:
+        path = os.path.join(tempfile.gettempdir(), "classifiers", model_name[: -len(".tar.gz")])
+        if os.path.exists(os.path.join(path, "config.json")):
+            return path
+        archive = os.path.join(self.model_dir, model_name)
+        downloaded = not os.path.exists(archive)
+        if downloaded:
+            if not CLASSIFIER_MODEL_S3_URI:
+                raise FileNotFoundError(f"No {model_name} in {self.model_dir} and CLASSIFIER_MODEL_S3_URI is not set")
+            bucket, _, prefix = CLASSIFIER_MODEL_S3_URI.removeprefix("s3://").partition("/")
+            os.makedirs(self.model_dir, exist_ok=True)
+            get_client("s3").download_file(bucket, f"{prefix.rstrip('/')}/{model_name}".lstrip("/"), archive)
+        # extracted aside and renamed, so an interrupted extraction is never taken for a model; the data filter
+        # rejects members with absolute paths, parent references or links out of the directory
+        shutil.rmtree(f"{path}.partial", ignore_errors=True)
+        with tarfile.open(archive) as tar:
+            tar.extractall(f"{path}.partial", filter="data")
+        os.replace(f"{path}.partial", path)
+        # a downloaded archive would keep a second copy of the model in the small /tmp of the functions
+        if downloaded:
+            os.remove(archive)
+        return path
+
+
+class FakeClassifier(ClassifierBackend):
+    """Deterministic scores derived from the text and the model name, for tests and benchmarks."""
+
+    CACHEABLE = False
+
+    def scores(self, model_name: str, texts: List[str]) -> List[float]:
+        return [
+            int(hashlib.sha256(f"{model_name}:{normalized_text_hash(text)}".encode()).hexdigest()[:8], 16) / 0xFFFFFFFF
+            for text in texts
+        ]
+
+
+_classifier: Optional[ClassifierBackend] = None
+_classifier_lock = threading.Lock()
+
+
+def get_classifier() -> ClassifierBackend:
+    global _classifier
+    with _classifier_lock:
+        if _classifier is None:
+            if CLASSIFIER_BACKEND == "local":
+                _classifier = LocalClassifier()
+            elif CLASSIFIER_BACKEND == "fake":
+                _classifier = FakeClassifier()
+            else:
+                if CLASSIFIER_BACKEND != "sagemaker":
+                    logger.error(f"Unknown classifier backend: {CLASSIFIER_BACKEND}, using sagemaker")
+                _classifier = SageMakerClassifier()
+        return _classifier
+
+
+def set_classifier(classifier: ClassifierBackend) -> None:
+    """Use `classifier` from now on, e.g. a FakeClassifier in tests."""
+    global _classifier
+    with _classifier_lock:
+        _classifier = classifier
@@ -9,10 +9,20 @@ AWS_REGION = "eu-central-1"
 RESOURCES_URL_PREFIX: str = os.environ.get("RESOURCES_URL_PREFIX")
 RDS_CONNECTION_URL = os.environ.get("RDS_CONNECTION_URL")
 SEND_EMAIL_TOPIC = os.environ.get("SEND_EMAIL_TOPIC")
+SQS_ENDPOINT_URL = os.environ.get("SQS_ENDPOINT_URL")  # e.g. a local SQS stand-in
+AWS_MAX_ATTEMPTS = int(os.environ.get("AWS_MAX_ATTEMPTS", 5))
+AWS_CONNECT_TIMEOUT = float(os.environ.get("AWS_CONNECT_TIMEOUT", 5))
+AWS_READ_TIMEOUT = float(os.environ.get("AWS_READ_TIMEOUT", 60))
 
 # DB connection
 DATABASE_DRIVER = os.environ.get("POSTGRES_DRIVER", "postgresql")
 POSTGRES_DB_URL = f"{DATABASE_DRIVER}://{RDS_CONNECTION_URL}"
+# "queue" keeps a small pool per container, "null" opens a connection per checkout, e.g. behind an RDS proxy
+DB_POOL_MODE = os.environ.get("DB_POOL_MODE", "queue")
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 300))
+DB_ECHO = os.environ.get("DB_ECHO", "false").lower() == "true"
+DB_SLOW_QUERY_MS = float(os.environ.get("DB_SLOW_QUERY_MS", 500))
 
 # ML config
 PREDICTION_ENDPOINT_NAME = "multimodel"
@@ -20,6 +30,64 @@ MODEL_NAME = "multimodel"
 ENDPOINT_CONFIG_NAME = "multimodel-endpoint-config"
 # ENDPOINT_NAME = "multimodel2"
 
+# ReliefWeb API
+RELIEF_WEB_API_URL = os.environ.get("RELIEF_WEB_API_URL", "https://api.reliefweb.int/v1")
+
 # Airtable conection
 AIR_TABLE_API_KEY = os.environ.get("AIR_TABLE_API_KEY")
 AIR_TABLE_APP_ID = os.environ.get("AIR_TABLE_APP_ID")
+AIR_TABLE_API_URL = os.environ.get("AIR_TABLE_API_URL", "https://api.airtable.com/v0")
+AIR_TABLE_MAX_REQUESTS_PER_SECOND = float(os.environ.get("AIR_TABLE_MAX_REQUESTS_PER_SECOND", 5))
+AIR_TABLE_MAX_BATCHES_IN_FLIGHT = int(os.environ.get("AIR_TABLE_MAX_BATCHES_IN_FLIGHT", 3))
+
+# Classification
+CLASSIFICATION_THRESHOLD = float(os.environ.get("CLASSIFICATION_THRESHOLD", 0.9))
+CLASSIFIER_BACKEND = os.environ.get("CLASSIFIER_BACKEND", "sagemaker")  # sagemaker, local or fake
+CLASSIFIER_MODEL_DIR = os.environ.get("CLASSIFIER_MODEL_DIR", "/tmp/models")  # model-*.tar.gz for the local backend
+CLASSIFIER_MODEL_S3_URI = os.environ.get("CLASSIFIER_MODEL_S3_URI")  # s3://bucket/prefix holding the archives
+CLASSIFIER_THREADS = int(os.environ.get("CLASSIFIER_THREADS", os.cpu_count() or 1))
+CLASSIFIER_BATCH_SIZE = int(os.environ.get("CLASSIFIER_BATCH_SIZE", 16))
+
+# Classification cache
+CLASSIFICATION_CACHE_BACKEND = os.environ.get("CLASSIFICATION_CACHE_BACKEND", "memory")  # memory, postgres or none
+CLASSIFICATION_CACHE_TTL = int(os.environ.get("CLASSIFICATION_CACHE_TTL", 30 * 24 * 60 * 60))
+CLASSIFICATION_CACHE_MAX_SIZE = int(os.environ.get("CLASSIFICATION_CACHE_MAX_SIZE", 100_000))
+
+# Translation memory
+TRANSLATION_MEMORY_BACKEND = os.environ.get("TRANSLATION_MEMORY_BACKEND", "memory")  # postgres or memory
+TRANSLATION_MEMORY_MAX_SIZE = int(os.environ.get("TRANSLATION_MEMORY_MAX_SIZE", 10_000))
+
+# NLTK models, packaged with the functions (see README)
+NLTK_DATA_DIR = os.environ.get("NLTK_DATA_DIR", os.path.join(os.path.dirname(basedir), "nltk_data"))
+
+# Monitored countries, cached from Airtable
+COUNTRY_CACHE_TTL = int(os.environ.get("COUNTRY_CACHE_TTL", 3 * 24 * 60 * 60))
+
+# Task making
+DAY_PROCESSING_LIMIT = int(os.environ.get("DAY_PROCESSING_LIMIT", 150))
+
+# Records of an SQS batch processed at once by the pdf and meta data processors
+SQS_BATCH_WORKERS = int(os.environ.get("SQS_BATCH_WORKERS", 4))
+
+# Concurrency limits, keep them under the SageMaker and Translate throttling quotas
+PAGE_PIPELINE_WORKERS = int(os.environ.get("PAGE_PIPELINE_WORKERS", 4))
+PAGE_PIPELINE_MAX_IN_FLIGHT = int(os.environ.get("PAGE_PIPELINE_MAX_IN_FLIGHT", 8))
+SAGEMAKER_MAX_CONCURRENCY = int(os.environ.get("SAGEMAKER_MAX_CONCURRENCY", 8))
+TRANSLATE_MAX_CONCURRENCY = int(os.environ.get("TRANSLATE_MAX_CONCURRENCY", 4))
+
+# DB pool of the "queue" mode, sized from the workers above: a connection kept for the session of every record of a
+# batch, and overflow connections for the short translation memory and classification cache queries made from the
+# page pipeline threads of those records when their postgres backends are on
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", SQS_BATCH_WORKERS))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", SQS_BATCH_WORKERS * PAGE_PIPELINE_WORKERS))
+
+# Document download
+DOWNLOAD_MAX_SIZE = int(os.environ.get("DOWNLOAD_MAX_SIZE", 200 * 1024 * 1024))
+DOWNLOAD_SPOOL_THRESHOLD = int(os.environ.get("DOWNLOAD_SPOOL_THRESHOLD", 16 * 1024 * 1024))
+DOWNLOAD_CONNECT_TIMEOUT = float(os.environ.get("DOWNLOAD_CONNECT_TIMEOUT", 10))
+DOWNLOAD_READ_TIMEOUT = float(os.environ.get("DOWNLOAD_READ_TIMEOUT", 60))
+
+# Tracing and metrics, emitted as JSON log lines or in the CloudWatch embedded metric format
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+METRICS_FORMAT = os.environ.get("METRICS_FORMAT", "json")  # json or emf
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "Sophia")
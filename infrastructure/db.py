@@ -1,15 +1,156 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker, scoped_session
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
 
-from infrastructure.config import POSTGRES_DB_URL
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import declarative_base, sessionmaker, scoped_session
+from sqlalchemy.pool import NullPool
 
-engine = create_engine(
+from infrastructure import metrics
+from infrastructure.config import (
     POSTGRES_DB_URL,
-    echo=True,
+    DB_POOL_MODE,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_ECHO,
+    DB_SLOW_QUERY_MS,
 )
 
-Session = sessionmaker(bind=engine, autoflush=True)
-Base = declarative_base()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
 
+if DB_POOL_MODE == "null":
+    pool_options: dict = dict(poolclass=NullPool)
+else:
+    pool_options = dict(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+engine = create_engine(POSTGRES_DB_URL, echo=DB_ECHO, **pool_options)
+
+Base = declarative_base()
 
 Session = scoped_session(sessionmaker(expire_on_commit=False, bind=engine, autoflush=True))
+
+
+class DBStats:
+    """Counters of the statements run and of the connections opened and checked out."""
+
+    FIELDS = ("queries", "query_ms", "connections_opened", "connect_ms", "checkouts")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = dict.fromkeys(self.FIELDS, 0.0)
+
+    def add(self, **values) -> None:
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+
+# process-wide counters, and those of the unit of work of the current context, which pool threads share through
+# metrics.in_context
+db_stats = DBStats()
+_unit_stats: contextvars.ContextVar = contextvars.ContextVar("unit_stats", default=None)
+
+
+def _add_stats(**values) -> None:
+    db_stats.add(**values)
+    unit_stats = _unit_stats.get()
+    if unit_stats is not None:
+        unit_stats.add(**values)
+
+
+@event.listens_for(engine, "do_connect")
+def _before_connect(dialect, conn_rec, cargs, cparams):
+    conn_rec.info["connect_start"] = time.perf_counter()
+
+
+@event.listens_for(engine.pool, "connect")
+def _after_connect(dbapi_connection, connection_record):
+    started = connection_record.info.pop("connect_start", None)
+    connect_ms = (time.perf_counter() - started) * 1000 if started is not None else 0.0
+    _add_stats(connections_opened=1, connect_ms=connect_ms)
+
+
+@event.listens_for(engine.pool, "checkout")
+def _checkout(dbapi_connection, connection_record, connection_proxy):
+    _add_stats(checkouts=1)
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    _end_query(conn, statement)
+
+
+@event.listens_for(engine, "handle_error")
+def _handle_error(exception_context):
+    # after_cursor_execute is not called for failed statements, their start time is taken off here instead
+    if exception_context.connection is not None and exception_context.connection.info.get("query_start"):
+        _end_query(exception_context.connection, exception_context.statement or "")
+
+
+def _end_query(conn, statement: str) -> None:
+    query_ms = (time.perf_counter() - conn.info["query_start"].pop()) * 1000
+    _add_stats(queries=1, query_ms=query_ms)
+    if query_ms > DB_SLOW_QUERY_MS:
+        logger.warning(f"Slow query ({query_ms:.0f} ms): {statement[:500]}")
+
+
+@contextmanager
+def unit_of_work(name: str):
+    """Session of one handler invocation: committed when the block succeeds, rolled back when it raises, and closed
+    in any case, so warm invocations never see objects of the previous one. Records the DB usage of the block,
+    counting only its own statements and connections when other units of work run in parallel threads."""
+    unit_stats = DBStats()
+    token = _unit_stats.set(unit_stats)
+    session = Session()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        Session.remove()
+        _unit_stats.reset(token)
+        usage = {key: round(value, 2) for key, value in unit_stats.snapshot().items()}
+        metrics.record("db_usage", usage, unit=name)
+
+
+def keyset_pages(session, statement, key_column, page_size: int = 500, scalars: bool = False) -> Iterator[list]:
+    """Run `statement` page by page in `key_column` order, resuming each page after the last key seen, so every
+    query is bounded and its cost does not grow with how far the scan got. Rows are fetched from a server-side
+    cursor `page_size` at a time; each page is fully read before it is yielded, so callers may commit between pages.
+    """
+    last_key = None
+    while True:
+        page = statement.order_by(key_column).limit(page_size).execution_options(yield_per=page_size)
+        if last_key is not None:
+            page = page.where(key_column > last_key)
+        result = session.execute(page)
+        rows = (result.scalars() if scalars else result).all()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        last_key = getattr(rows[-1], key_column.key)
@@ -0,0 +1,81 @@
+import io
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+import requests
+
+from infrastructure import metrics
+from infrastructure.config import (
+    DOWNLOAD_MAX_SIZE,
+    DOWNLOAD_SPOOL_THRESHOLD,
+    DOWNLOAD_CONNECT_TIMEOUT,
+    DOWNLOAD_READ_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class DownloadTooLarge(Exception):
+    pass
+
+
+@dataclass
+class DownloadedFile:
+    """Downloaded content, kept in memory when small and spooled to a temp file otherwise."""
+
+    size: int
+    data: Optional[bytes] = None
+    path: Optional[str] = None
+
+
+@contextmanager
+def download_file(
+    url: str,
+    max_size: int = DOWNLOAD_MAX_SIZE,
+    spool_threshold: int = DOWNLOAD_SPOOL_THRESHOLD,
+    timeout: tuple = (DOWNLOAD_CONNECT_TIMEOUT, DOWNLOAD_READ_TIMEOUT),
+) -> Iterator[DownloadedFile]:
+    """Stream url in chunks, failing with DownloadTooLarge past max_size. The temp file, if any, is removed
+    when the context exits."""
+    buffer = io.BytesIO()
+    spool_file = None
+    size = 0
+    try:
+        metrics.count("download")
+        with metrics.span("download"), requests.get(url, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            if int(response.headers.get("Content-Length") or 0) > max_size:
+                raise DownloadTooLarge(f"{url} is {response.headers['Content-Length']} bytes, limit is {max_size}")
+
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise DownloadTooLarge(f"{url} is over the {max_size} bytes limit")
+                if spool_file is None and size > spool_threshold:
+                    spool_file = tempfile.NamedTemporaryFile(suffix=".download", delete=False)
+                    spool_file.write(buffer.getbuffer())
+                    buffer = io.BytesIO()
+                (spool_file or buffer).write(chunk)
+
+        if spool_file is not None:
+            spool_file.close()
+            downloaded = DownloadedFile(size=size, path=spool_file.name)
+        else:
+            downloaded = DownloadedFile(size=size, data=buffer.getvalue())
+        buffer = io.BytesIO()
+        metrics.record(
+            "document_download",
+            {"bytes_downloaded": size, "spooled_to_disk": spool_file is not None, "peak_rss_mb": metrics.peak_rss_mb()},
+        )
+        yield downloaded
+    finally:
+        if spool_file is not None:
+            spool_file.close()
+            os.remove(spool_file.name)
@@ -0,0 +1,44 @@
+import threading
+from typing import Dict, Iterable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_http_session(
+    name: str,
+    pool_size: int = 10,
+    retries: int = 5,
+    backoff_factor: float = 0.5,
+    retry_statuses: Iterable[int] = DEFAULT_RETRY_STATUSES,
+    retry_methods: Iterable[str] = ("GET", "POST"),
+    read_retries: Optional[int] = None,
+) -> requests.Session:
+    """Return a pooled session for `name`, created on first use and kept for warm invocations.
+
+    Failed requests are retried with exponential backoff, honouring Retry-After. Set `read_retries` to 0 when a
+    request the server may have received must not be sent again.
+    """
+    with _sessions_lock:
+        if name not in _sessions:
+            retry = Retry(
+                total=retries,
+                read=read_retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=list(retry_statuses),
+                allowed_methods=frozenset(retry_methods),
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[name] = session
+        return _sessions[name]
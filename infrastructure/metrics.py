@@ -0,0 +1,208 @@
+import contextvars
+import functools
+import json
+import logging
+import resource
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+from infrastructure.config import METRICS_ENABLED, METRICS_FORMAT, METRICS_NAMESPACE
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+class Trace:
+    """Span timings, external call counts, totals and recorded values of one unit of work, e.g. one document.
+
+    Work done in pool threads goes to the trace of the thread which submitted it (see in_context), so span times
+    are summed over threads and may add up to more than the trace duration.
+    """
+
+    def __init__(self, unit: str, properties: dict):
+        self.unit = unit
+        self.properties = properties
+        self.spans: dict = defaultdict(lambda: [0, 0.0])
+        self.calls: Counter = Counter()
+        self.totals: Counter = Counter()
+        self.values: dict = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, elapsed_ms: float) -> None:
+        with self._lock:
+            span_stats = self.spans[name]
+            span_stats[0] += 1
+            span_stats[1] += elapsed_ms
+
+    def count(self, service: str, calls: int) -> None:
+        with self._lock:
+            self.calls[service] += calls
+
+    def add_totals(self, metric: str, amounts: dict) -> None:
+        with self._lock:
+            self.totals.update({f"{metric}_{key}": amount for key, amount in amounts.items()})
+
+    def add_values(self, metric: str, values: dict) -> None:
+        with self._lock:
+            self.values.update({f"{metric}_{key}": value for key, value in values.items()})
+
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def trace(unit: str, **properties) -> Iterator[Optional[Trace]]:
+    """Collect the spans, calls and values of the block and emit them as one summary when it exits."""
+    if not METRICS_ENABLED:
+        yield None
+        return
+    current = Trace(unit, properties)
+    token = _current_trace.set(current)
+    start = time.perf_counter()
+    failed = True
+    try:
+        yield current
+        failed = False
+    finally:
+        _current_trace.reset(token)
+        _emit_trace(current, (time.perf_counter() - start) * 1000, failed)
+
+
+class _Span:
+    __slots__ = ("name", "_trace", "_start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self._trace = _current_trace.get()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._trace is not None:
+            self._trace.add_span(self.name, (time.perf_counter() - self._start) * 1000)
+        return False
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str):
+    """Context manager timing its block as the span `name` of the current trace."""
+    return _Span(name) if METRICS_ENABLED else _NULL_SPAN
+
+
+def timed(name: str) -> Callable:
+    """Decorator timing each call of the function as the span `name` of the current trace."""
+
+    def decorator(func: Callable) -> Callable:
+        if not METRICS_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(service: str, calls: int = 1) -> None:
+    """Count calls to an external service in the current trace."""
+    if METRICS_ENABLED:
+        current = _current_trace.get()
+        if current is not None:
+            current.count(service, calls)
+
+
+def add(metric: str, **amounts) -> None:
+    """Add amounts, e.g. cache hits, to the totals of the current trace, with their keys prefixed by `metric`.
+    Counted as they happen, so they only cover the trace even while other traces run in parallel threads."""
+    if METRICS_ENABLED:
+        current = _current_trace.get()
+        if current is not None:
+            current.add_totals(metric, amounts)
+
+
+def record(metric: str, values: dict, **properties) -> None:
+    """Add values to the current trace, with their keys prefixed by `metric`, or emit them on their own outside of
+    a trace."""
+    if not METRICS_ENABLED:
+        return
+    current = _current_trace.get()
+    if current is not None:
+        current.add_values(metric, values)
+    else:
+        _emit(metric, properties, values)
+
+
+def in_context(func: Callable) -> Callable:
+    """Wrap func to run in the caller's context, so that what it does in pool threads goes to the caller's trace."""
+    if not METRICS_ENABLED:
+        return func
+    context = contextvars.copy_context()
+
+    def run_in_context(*args, **kwargs):
+        # a context can only be entered by one thread at a time, every call gets a copy of it
+        return context.copy().run(func, *args, **kwargs)
+
+    return run_in_context
+
+
+def _emit_trace(current: Trace, total_ms: float, failed: bool) -> None:
+    values = {"total_ms": round(total_ms, 1), "peak_rss_mb": peak_rss_mb()}
+    for name, (span_count, span_ms) in current.spans.items():
+        values[f"{name}_ms"] = round(span_ms, 1)
+        values[f"{name}_count"] = span_count
+    values.update({f"calls_{service}": calls for service, calls in current.calls.items()})
+    values.update({key: round(total, 2) for key, total in current.totals.items()})
+    values.update(current.values)
+    _emit("trace", dict(current.properties, unit=current.unit, failed=failed), values)
+
+
+def _emit(metric: str, properties: dict, values: dict) -> None:
+    if METRICS_FORMAT == "emf":
+        # CloudWatch embedded metric format, extracted from the raw log line: numbers become metrics of the unit
+        numbers = [
+            key for key, value in values.items() if isinstance(value, (int, float)) and not isinstance(value, bool)
+        ]
+        document = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": METRICS_NAMESPACE,
+                        "Dimensions": [["metric", "unit"] if "unit" in properties else ["metric"]],
+                        "Metrics": [
+                            {"Name": key, "Unit": "Milliseconds" if key.endswith("_ms") else "None"} for key in numbers
+                        ],
+                    }
+                ],
+            },
+            "metric": metric,
+            **properties,
+            **values,
+        }
+        sys.stdout.write(json.dumps(document, default=str) + "\n")
+    else:
+        logger.info(json.dumps({"metric": metric, **properties, **values}, default=str))
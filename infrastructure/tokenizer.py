@@ -0,0 +1,20 @@
+from functools import lru_cache
+from typing import List
+
+from nltk import data as nltk_data
+
+from infrastructure.config import NLTK_DATA_DIR
+
+# Searched first, so the packaged models are found without any download.
+if NLTK_DATA_DIR not in nltk_data.path:
+    nltk_data.path.insert(0, NLTK_DATA_DIR)
+
+
+@lru_cache(maxsize=None)
+def get_sentence_tokenizer(language: str = "english"):
+    """Load the punkt model of `language` once per process. Raises LookupError when it is not installed."""
+    return nltk_data.load(f"tokenizers/punkt/{language}.pickle")
+
+
+def sent_tokenize(text: str, language: str = "english") -> List[str]:
+    return get_sentence_tokenizer(language).tokenize(text)
@@ -0,0 +1,40 @@
+import hashlib
+import unicodedata
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator
+
+from infrastructure import metrics
+
+
+def normalized_text_hash(text: str) -> str:
+    normalized = " ".join(unicodedata.normalize("NFKC", text).split())
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def ordered_map(func: Callable, items: Iterable, max_workers: int, max_in_flight: int) -> Iterator:
+    """Like map, but runs func in a thread pool with at most max_in_flight items pulled from items ahead
+    of the consumer. Results are yielded in input order."""
+    func = metrics.in_context(func)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures: deque = deque()
+    try:
+        for item in items:
+            futures.append(executor.submit(func, item))
+            if len(futures) >= max_in_flight:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def chunked(items: Iterable, size: int) -> Iterator[list]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,12 @@
+from sqlalchemy import Column
+from sqlalchemy import String, Float, DateTime
+
+from infrastructure.db import Base
+
+
+class ClassificationCacheEntry(Base):  # type: ignore
+    __tablename__ = "classification_cache"
+
+    key = Column("CacheKey", String, primary_key=True)
+    score = Column("Score", Float)
+    date_created = Column("DateCreated", DateTime, index=True)
@@ -1,6 +1,6 @@
 import sqlalchemy
 from sqlalchemy import Column
-from sqlalchemy import String, Boolean
+from sqlalchemy import String, Boolean, DateTime
 from sqlalchemy.dialects.postgresql import ARRAY
 
 from infrastructure.db import Base
@@ -21,3 +21,5 @@ class Country(Base):  # type: ignore
     Priority = Column("Priority", Boolean)
     AnalystAccount = Column("AnalystAccount", String)
     DataCollectorAccount = Column("DataCollectorAccount", String)
+    # set for the countries monitored as of the last sync with Airtable, None for the others
+    SyncedAt = Column("SyncedAt", DateTime(timezone=True))
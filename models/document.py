@@ -1,6 +1,6 @@
 import sqlalchemy
-from sqlalchemy import Column
-from sqlalchemy import String, Integer, Boolean, DateTime
+from sqlalchemy import Column, ForeignKey, Identity, Index
+from sqlalchemy import String, Integer, Float, Boolean, DateTime
 from sqlalchemy.dialects.postgresql import ARRAY
 
 from infrastructure.db import Base
@@ -12,6 +12,7 @@ class Document(Base):  # type: ignore
     __tablename__ = "documents"
 
     id = Column("RecordID", Integer, primary_key=True, autoincrement=True)
+    relief_web_id = Column("ReliefWebID", Integer, unique=True)
     iso3 = Column("ISO3", String)  # , ForeignKey("countries.ISO3"))
     source_name = Column("SourceName", String)
     format = Column("DocumentFormat", String)
@@ -41,20 +42,27 @@ class Document(Base):  # type: ignore
     failed = Column("Failed", Boolean, default=False)
 
 
-# class Snippet(Base):  # type: ignore
-#     __tablename__ = "text_snippets"
-#
-#     id = Column("SnippetID", Integer, Identity(start=1), primary_key=True)
-#     record_id = Column("RecordID", Integer, ForeignKey("documents.RecordID"))
-#     snippet_text = Column("SnippetText", String)
-#     snippet_classification = Column("SnippetClassification", ARRAY(String))  # type: ignore
-#     date_classified = Column("DateClassified", DateTime)
-#
-#
-# class Box(Base):  # type: ignore
-#     __tablename__ = "pdf_boxes"
-#
-#     box_id = Column("BoxID", Integer, Identity(start=1), primary_key=True)
-#     snippet_id = Column("SnippetID", Integer, ForeignKey("text_snippets.SnippetID"))
-#     page = Column("Page", Integer)
-#     location = Column("Location", ARRAY(Integer))  # type: ignore
+class Snippet(Base):  # type: ignore
+    __tablename__ = "text_snippets"
+    __table_args__ = (
+        # for label lookups such as "SnippetClassification" @> ARRAY['tag_Protection']
+        Index("ix_text_snippets_classification", "SnippetClassification", postgresql_using="gin"),
+    )
+
+    id = Column("SnippetID", Integer, Identity(start=1), primary_key=True)
+    record_id = Column("RecordID", Integer, ForeignKey("documents.RecordID", ondelete="CASCADE"), index=True)
+    snippet_text = Column("SnippetText", String)
+    snippet_classification = Column("SnippetClassification", ARRAY(String))  # type: ignore
+    snippet_scores = Column("SnippetScores", ARRAY(Float))  # type: ignore  # one score per model, in MODELS order
+    date_classified = Column("DateClassified", DateTime)
+
+
+class Box(Base):  # type: ignore
+    __tablename__ = "pdf_boxes"
+
+    box_id = Column("BoxID", Integer, Identity(start=1), primary_key=True)
+    snippet_id = Column("SnippetID", Integer, ForeignKey("text_snippets.SnippetID", ondelete="CASCADE"), index=True)
+    page = Column("Page", Integer)
+    # x0, y0, x1, y1 on the page: the lines of the snippet for untranslated documents, an approximate band of its
+    # block, sized after the snippet share of the block text, for translated ones
+    location = Column("Location", ARRAY(Float))  # type: ignore
@@ -0,0 +1,13 @@
+from sqlalchemy import Column
+from sqlalchemy import String, Integer, DateTime
+
+from infrastructure.db import Base
+
+
+class ScraperWatermark(Base):  # type: ignore
+    __tablename__ = "scraper_watermarks"
+
+    name = Column("Name", String, primary_key=True)
+    last_created = Column("LastCreated", DateTime(timezone=True))
+    last_relief_web_id = Column("LastReliefWebID", Integer)
+    date_updated = Column("DateUpdated", DateTime(timezone=True))
@@ -0,0 +1,13 @@
+from sqlalchemy import Column
+from sqlalchemy import String, DateTime
+
+from infrastructure.db import Base
+
+
+class TranslationMemoryEntry(Base):  # type: ignore
+    __tablename__ = "translation_memory"
+
+    source_language = Column("SourceLanguage", String, primary_key=True)
+    text_hash = Column("TextHash", String, primary_key=True)
+    translated_text = Column("TranslatedText", String)
+    date_created = Column("DateCreated", DateTime)
@@ -0,0 +1,12 @@
+// Resolved by serverless.yml while packaging: fails the deploy when the punkt model would not be packaged.
+const fs = require("fs");
+const path = require("path");
+
+const PUNKT = path.join(__dirname, "nltk_data", "tokenizers", "punkt", "english.pickle");
+
+module.exports = () => {
+  if (!fs.existsSync(PUNKT)) {
+    throw new Error(`${PUNKT} is missing, run \`npm run nltk-data\` before deploying`);
+  }
+  return PUNKT;
+};
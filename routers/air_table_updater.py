@@ -1,7 +1,9 @@
 import logging
 import traceback
 
-from services.pdf_document_service import PDFDocumentService
+from infrastructure import metrics
+from infrastructure.db import unit_of_work
+from services.air_table_service import AirTableService
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -9,6 +11,7 @@ logger.setLevel(logging.INFO)
 
 def run(event, context):
     try:
-        PDFDocumentService.update_air_table()
+        with metrics.trace("air_table_sync"), unit_of_work("air_table_updater") as session:
+            AirTableService.update_air_table(session)
     except Exception:
         logger.error(traceback.format_exc())
@@ -2,12 +2,16 @@ import logging
 import traceback
 
 from infrastructure.aws import delete_ml_endpoint
+from infrastructure.config import CLASSIFIER_BACKEND
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
 def run(event, context):
+    if CLASSIFIER_BACKEND != "sagemaker":
+        logger.info(f"Classifier backend is {CLASSIFIER_BACKEND}, the endpoint is not used")
+        return
     try:
         delete_ml_endpoint()
     except Exception:
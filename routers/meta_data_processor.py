@@ -1,15 +1,19 @@
 import logging
-import traceback
 
-from services.pdf_document_service import PDFDocumentService
+from infrastructure import metrics
+from infrastructure.aws import process_sqs_batch
+from infrastructure.config import SQS_BATCH_WORKERS
+from infrastructure.db import unit_of_work
+from services.meta_data_service import MetaDataService
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
+def process_record(record: dict) -> None:
+    with metrics.trace("meta_document", document_id=record["body"]), unit_of_work("meta_data_processor") as session:
+        MetaDataService.process_body(session, record["body"])
+
+
 def run(event, context):
-    try:
-        for record in event["Records"]:
-            PDFDocumentService.process_body(record["body"])
-    except Exception:
-        logger.error(traceback.format_exc())
+    return process_sqs_batch(event, process_record, SQS_BATCH_WORKERS)
@@ -1,15 +1,19 @@
 import logging
-import traceback
 
+from infrastructure import metrics
+from infrastructure.aws import process_sqs_batch
+from infrastructure.config import SQS_BATCH_WORKERS
+from infrastructure.db import unit_of_work
 from services.pdf_document_service import PDFDocumentService
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
+def process_record(record: dict) -> None:
+    with metrics.trace("pdf_document", document_id=record["body"]), unit_of_work("pdf_processor") as session:
+        PDFDocumentService.process_document(session, record["body"])
+
+
 def run(event, context):
-    try:
-        for record in event["Records"]:
-            PDFDocumentService.process_document(record["body"])
-    except Exception:
-        logger.error(traceback.format_exc())
+    return process_sqs_batch(event, process_record, SQS_BATCH_WORKERS)
@@ -0,0 +1,24 @@
+import logging
+import traceback
+
+from infrastructure import metrics
+from infrastructure.config import CLASSIFICATION_THRESHOLD
+from infrastructure.db import unit_of_work
+from services.reclassify_service import ReclassifyService
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def run(event, context):
+    # invoked manually, e.g. with {"threshold": 0.8}, {"threshold": 0.8, "record_ids": [1, 2], "render": true}
+    try:
+        with metrics.trace("reclassify"), unit_of_work("reclassifier") as session:
+            return ReclassifyService.reclassify(
+                session,
+                float(event.get("threshold", CLASSIFICATION_THRESHOLD)),
+                event.get("record_ids"),
+                bool(event.get("render", False)),
+            )
+    except Exception:
+        logger.error(traceback.format_exc())
@@ -2,18 +2,30 @@ import datetime
 import logging
 import traceback
 
+from infrastructure import metrics
+from infrastructure.db import unit_of_work
 from services.relief_web_service import ReliefWebService
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
+def parse_date(value: str) -> datetime.datetime:
+    date = datetime.datetime.fromisoformat(value)
+    return date if date.tzinfo else date.replace(tzinfo=datetime.timezone.utc)
+
+
 def run(event, context):
     #  code to process pdf document
     try:
         current_time = datetime.datetime.now().time()
         name = context.function_name
         logger.info("Your cron function " + name + " ran at " + str(current_time))
-        ReliefWebService.scrap_week_data()
+        with metrics.trace("relief_web_scrape"), unit_of_work("relief_web_scrubber") as session:
+            # a manual invocation with {"from": ..., "to": ...} backfills that range, the schedule scrapes new reports
+            if event.get("from") and event.get("to"):
+                ReliefWebService.backfill(session, parse_date(event["from"]), parse_date(event["to"]))
+            else:
+                ReliefWebService.scrap_week_data(session)
     except Exception:
         logger.error(traceback.format_exc())
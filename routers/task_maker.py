@@ -2,7 +2,9 @@ import datetime
 import logging
 import traceback
 
-from services.pdf_document_service import PDFDocumentService
+from infrastructure import metrics
+from infrastructure.db import unit_of_work
+from services.task_service import TaskService
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -14,6 +16,7 @@ def run(event, context):
         current_time = datetime.datetime.now().time()
         name = context.function_name
         logger.info("Your cron function " + name + " ran at " + str(current_time))
-        PDFDocumentService.make_tasks_for_processing()
+        with metrics.trace("task_making"), unit_of_work("task_maker") as session:
+            TaskService.make_tasks_for_processing(session)
     except Exception:
         logger.error(traceback.format_exc())
@@ -1,9 +1,24 @@
 import logging
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
-import requests
+
+from sqlalchemy import select, update, and_
+from sqlalchemy.orm import load_only
 
 from models.document import Document
-from infrastructure.config import AIR_TABLE_API_KEY, AIR_TABLE_APP_ID
+from infrastructure.config import (
+    AIR_TABLE_API_KEY,
+    AIR_TABLE_APP_ID,
+    AIR_TABLE_API_URL,
+    AIR_TABLE_MAX_REQUESTS_PER_SECOND,
+    AIR_TABLE_MAX_BATCHES_IN_FLIGHT,
+)
+from infrastructure import metrics
+from infrastructure.aws import send_email
+from infrastructure.db import keyset_pages
+from infrastructure.http import get_http_session
+from infrastructure.rate_limit import TokenBucket
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -11,44 +26,90 @@ logger.setLevel(logging.INFO)
 
 class AirTableService:
     BATCH_MAX_COUNT = 10
-    AIR_TABLE_DOCUMENT_URL = f"https://api.airtable.com/v0/{AIR_TABLE_APP_ID}/tblT5ISXLvn7Uy80F"
-    AIR_TABLE_ISO3_URL = f"https://api.airtable.com/v0/{AIR_TABLE_APP_ID}/tblPoIADo5pGxyO76"
+    SYNC_PAGE_SIZE = 200
+    REQUEST_TIMEOUT = (10, 60)
+    AIR_TABLE_DOCUMENT_URL = f"{AIR_TABLE_API_URL}/{AIR_TABLE_APP_ID}/tblT5ISXLvn7Uy80F"
+    AIR_TABLE_ISO3_URL = f"{AIR_TABLE_API_URL}/{AIR_TABLE_APP_ID}/tblPoIADo5pGxyO76"
+    # the columns read by _to_record, for loading documents without the ones the sync never uses
+    RECORD_COLUMNS = (
+        Document.iso3,
+        Document.source_name,
+        Document.format,
+        Document.date_relief_web,
+        Document.date_published,
+        Document.source_link,
+        Document.relief_web_link,
+        Document.attachment_link,
+        Document.date_downloaded,
+        Document.language,
+        Document.title,
+        Document.document_text,
+        Document.model_classification,
+        Document.failed,
+        Document.title_translated,
+        Document.text_translated,
+        Document.modified_pdf_link,
+        Document.translated,
+        Document.iso3_multiple,
+    )
+    # Airtable allows 5 requests per second per base
+    _rate_limiter = TokenBucket(AIR_TABLE_MAX_REQUESTS_PER_SECOND)
 
     @classmethod
-    def create_records(cls, documents: List[Document]) -> bool:
-        records = []
+    def update_air_table(cls, session):
+        query = (
+            select(Document)
+            .filter(and_(Document.synchronized.is_(False)), Document.processed.is_(True))
+            .options(load_only(*cls.RECORD_COLUMNS))
+        )
+        num_documents = 0
+        synced_ids = []
+        for documents in keyset_pages(session, query, Document.id, page_size=cls.SYNC_PAGE_SIZE, scalars=True):
+            num_documents += len(documents)
+            page_synced_ids = cls.sync_documents(documents)
+            if page_synced_ids:
+                session.execute(
+                    update(Document).where(Document.id.in_(page_synced_ids)).values(synchronized=True),
+                    execution_options={"synchronize_session": False},
+                )
+                session.commit()
+            synced_ids.extend(page_synced_ids)
+            session.expunge_all()
 
-        for document in documents:
-            air_table_rec = {
-                "fields": {
-                    "RecordID": document.id,
-                    "ISO3": document.iso3,
-                    "SourceName": document.source_name,
-                    "DocumentFormat": document.format,
-                    "DateReliefWeb": document.date_relief_web.isoformat() if document.date_relief_web else "",
-                    "DatePublished": document.date_published.strftime("%m/%d/%Y") if document.date_published else "",
-                    "SourceLink": document.source_link,
-                    "ReliefWebLink": document.relief_web_link,
-                    "AttachmentLink": document.attachment_link,
-                    "DateDownloaded": document.date_downloaded.isoformat() if document.date_downloaded else "",
-                    "Language": document.language,
-                    "Title": document.title,
-                    "DocumentText": document.document_text,
-                    "ModelClassification": document.model_classification if not document.failed else "FAILED",
-                    "TitleTranslated": document.title_translated,
-                    "TextTranslated": document.text_translated,
-                    "ModifiedPDFLink": document.modified_pdf_link,
-                    "Translated": document.translated,
-                    "ISO3Multiple": ", ".join(document.iso3_multiple),
-                }
-            }
-            records.append(air_table_rec)
+        message = f"Doc sync to AirTable base: {len(synced_ids)} of {num_documents} docs were synced to Airtable."
+        logger.info(message)
+        send_email(message)
+
+    @classmethod
+    def sync_documents(cls, documents: List[Document]) -> List[int]:
+        """Create Airtable records for the documents, with a few batches in flight at once, and return the ids of
+        the documents which were synchronized."""
+        batches = []
+        for start in range(0, len(documents), cls.BATCH_MAX_COUNT):
+            end = start + cls.BATCH_MAX_COUNT
+            batch = documents[start:end]
+            batches.append(([document.id for document in batch], [cls._to_record(document) for document in batch]))
 
+        with ThreadPoolExecutor(max_workers=AIR_TABLE_MAX_BATCHES_IN_FLIGHT) as executor:
+            results = list(executor.map(metrics.in_context(lambda batch: cls._post_records(batch[1])), batches))
+        return [doc_id for (doc_ids, _), created in zip(batches, results) if created for doc_id in doc_ids]
+
+    @classmethod
+    def _post_records(cls, records: List[dict]) -> bool:
         request_body = {
             "records": records,
         }
-        barer_header = {"Authorization": f"Bearer {AIR_TABLE_API_KEY}"}
-        response = requests.post(cls.AIR_TABLE_DOCUMENT_URL, json=request_body, headers=barer_header)
+        cls._rate_limiter.acquire()
+        metrics.count("airtable")
+        try:
+            with metrics.span("airtable"):
+                response = cls._write_http().post(
+                    cls.AIR_TABLE_DOCUMENT_URL, json=request_body, headers=cls._headers(), timeout=cls.REQUEST_TIMEOUT
+                )
+        except Exception:
+            # only this batch stays unsynchronized, the others are still marked
+            logger.error(traceback.format_exc())
+            return False
         if response.status_code != 200:
             logger.error(response.__dict__)
             return False
@@ -56,12 +117,68 @@ class AirTableService:
             logger.info("AirTable was updated")
             return True
 
+    @staticmethod
+    def _to_record(document: Document) -> dict:
+        return {
+            "fields": {
+                "RecordID": document.id,
+                "ISO3": document.iso3,
+                "SourceName": document.source_name,
+                "DocumentFormat": document.format,
+                "DateReliefWeb": document.date_relief_web.isoformat() if document.date_relief_web else "",
+                "DatePublished": document.date_published.strftime("%m/%d/%Y") if document.date_published else "",
+                "SourceLink": document.source_link,
+                "ReliefWebLink": document.relief_web_link,
+                "AttachmentLink": document.attachment_link,
+                "DateDownloaded": document.date_downloaded.isoformat() if document.date_downloaded else "",
+                "Language": document.language,
+                "Title": document.title,
+                "DocumentText": document.document_text,
+                "ModelClassification": document.model_classification if not document.failed else "FAILED",
+                "TitleTranslated": document.title_translated,
+                "TextTranslated": document.text_translated,
+                "ModifiedPDFLink": document.modified_pdf_link,
+                "Translated": document.translated,
+                "ISO3Multiple": ", ".join(document.iso3_multiple),
+            }
+        }
+
+    @staticmethod
+    def _headers() -> dict:
+        return {"Authorization": f"Bearer {AIR_TABLE_API_KEY}"}
+
+    @staticmethod
+    def _http():
+        return get_http_session("air_table", pool_size=AIR_TABLE_MAX_BATCHES_IN_FLIGHT, backoff_factor=1)
+
+    @staticmethod
+    def _write_http():
+        # Record creation is only retried when Airtable surely did not create the records: on 429 and when the
+        # connection failed. A 5xx or a read timeout may come after the records were created.
+        return get_http_session(
+            "air_table_write",
+            pool_size=AIR_TABLE_MAX_BATCHES_IN_FLIGHT,
+            backoff_factor=1,
+            retry_statuses=(429,),
+            retry_methods=("POST",),
+            read_retries=0,
+        )
+
     @classmethod
-    def get_iso3(cls):
-        barer_header = {"Authorization": f"Bearer {AIR_TABLE_API_KEY}"}
-        url = cls.AIR_TABLE_ISO3_URL + "?filterByFormula=IF({Data Collector}= BLANK(), 'Skip', 'Monitor')"
-        resp = requests.get(url, headers=barer_header)
-        if resp.status_code == 200:
-            return [i["fields"]["ISO3"].lower() for i in resp.json().get("records", [])]
-        else:
-            return []
+    def get_iso3(cls) -> List[str]:
+        """Return the ISO3 codes of the monitored countries, following Airtable pagination. Raises on failure."""
+        params = {"filterByFormula": "IF({Data Collector}= BLANK(), 'Skip', 'Monitor')", "pageSize": 100}
+        iso3 = []
+        while True:
+            cls._rate_limiter.acquire()
+            metrics.count("airtable")
+            with metrics.span("airtable"):
+                resp = cls._http().get(
+                    cls.AIR_TABLE_ISO3_URL, params=params, headers=cls._headers(), timeout=cls.REQUEST_TIMEOUT
+                )
+            resp.raise_for_status()
+            page = resp.json()
+            iso3.extend(record["fields"]["ISO3"].lower() for record in page.get("records", []))
+            if not page.get("offset"):
+                return iso3
+            params["offset"] = page["offset"]
@@ -0,0 +1,64 @@
+import logging
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import List, Set
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from infrastructure.config import COUNTRY_CACHE_TTL
+from models.country import Country
+from services.air_table_service import AirTableService
+from services.utils import DEFAULT_COUNTRIES
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class CountryService:
+    """Provides the monitored countries, cached in the countries table for COUNTRY_CACHE_TTL seconds."""
+
+    CACHE_TTL = timedelta(seconds=COUNTRY_CACHE_TTL)
+
+    @classmethod
+    def get_iso3(cls, session) -> List[str]:
+        """Return the lower case ISO3 codes of the monitored countries.
+
+        The cached set is used while fresh, otherwise it is refreshed from Airtable. When Airtable fails, the cached
+        set is used however old it is, and DEFAULT_COUNTRIES when nothing was ever cached.
+        """
+        cached, synced_at = cls._get_cached(session)
+        if cached and synced_at > datetime.now(tz=timezone.utc) - cls.CACHE_TTL:
+            return sorted(iso3.lower() for iso3 in cached)
+
+        try:
+            monitored = {iso3.upper() for iso3 in AirTableService.get_iso3()}
+        except Exception:
+            logger.error(f"Can't get countries from Airtable: {traceback.format_exc()}")
+            monitored = set()
+        if not monitored:
+            fallback = cached or {iso3.upper() for iso3 in DEFAULT_COUNTRIES}
+            logger.warning(f"Using {'cached' if cached else 'default'} countries: {len(fallback)}")
+            return sorted(iso3.lower() for iso3 in fallback)
+
+        cls._save(session, monitored, cached)
+        return sorted(iso3.lower() for iso3 in monitored)
+
+    @staticmethod
+    def _get_cached(session):
+        rows = session.execute(select(Country.ISO3, Country.SyncedAt).filter(Country.SyncedAt.is_not(None))).all()
+        return {row.ISO3 for row in rows}, max((row.SyncedAt for row in rows), default=None)
+
+    @staticmethod
+    def _save(session, monitored: Set[str], cached: Set[str]) -> None:
+        added = monitored - cached
+        removed = cached - monitored
+        if added or removed:
+            logger.info(f"Monitored countries changed, added: {sorted(added)}, removed: {sorted(removed)}")
+        if removed:
+            # rows are kept, with the rest of the country data, and only left out of the monitored set
+            session.execute(update(Country).where(Country.ISO3.in_(removed)).values(SyncedAt=None))
+        now = datetime.now(tz=timezone.utc)
+        stmt = insert(Country.__table__).values([{"ISO3": iso3, "SyncedAt": now} for iso3 in sorted(monitored)])
+        session.execute(stmt.on_conflict_do_update(index_elements=["ISO3"], set_={"SyncedAt": stmt.excluded.SyncedAt}))
+        session.commit()
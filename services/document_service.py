@@ -0,0 +1,58 @@
+from datetime import datetime, timezone
+from typing import List
+
+from sqlalchemy import delete, insert, select
+
+from infrastructure import metrics
+from models.document import Box, Document, Snippet
+from services.snippet_segmenter import SnippetSegmenter
+from services.translation_service import TranslationService
+
+
+class DocumentService:
+    """Base of the services processing a single scraped document."""
+
+    ISO3_ENG = "en"
+    MIN_TEXT_BLOCK = 20
+    MAX_SNIPED_SIZE = 80
+    SEGMENTER = SnippetSegmenter(MIN_TEXT_BLOCK, MAX_SNIPED_SIZE)
+
+    @staticmethod
+    def _get_document_by_id(session, doc_id: str) -> Document:
+        query = select(Document).filter(Document.id == int(doc_id))
+        res = session.execute(query).scalar_one()
+        return res
+
+    @staticmethod
+    @metrics.timed("save_snippets")
+    def _save_snippets(session, record_id: int, snippets: List[dict]) -> None:
+        """Replace the stored snippets of a document with `snippets`, dicts of text, labels and scores, and for PDF
+        snippets page and bbox. Rows are inserted in bulk, one statement per table."""
+        session.execute(delete(Snippet).where(Snippet.record_id == record_id))
+        if not snippets:
+            return
+        date_classified = datetime.now(tz=timezone.utc)
+        snippet_ids = session.scalars(
+            insert(Snippet).returning(Snippet.id, sort_by_parameter_order=True),
+            [
+                dict(
+                    record_id=record_id,
+                    snippet_text=snippet["text"],
+                    snippet_classification=snippet["labels"],
+                    snippet_scores=snippet["scores"],
+                    date_classified=date_classified,
+                )
+                for snippet in snippets
+            ],
+        ).all()
+        boxes = [
+            dict(snippet_id=snippet_id, page=snippet["page"], location=list(snippet["bbox"]))
+            for snippet_id, snippet in zip(snippet_ids, snippets)
+            if snippet.get("bbox")
+        ]
+        if boxes:
+            session.execute(insert(Box), boxes)
+
+    @classmethod
+    def _translate_text(cls, text: str, iso3_lang: str = "auto", aws_translate=None):
+        return TranslationService.translate(text, iso3_lang, aws_translate)
@@ -0,0 +1,89 @@
+import logging
+from collections import defaultdict
+from typing import List, Tuple
+
+from sqlalchemy import select
+
+from infrastructure import metrics
+from infrastructure.aws import get_translation_service, labels_from_scores, predict_scores_batch
+from infrastructure.tokenizer import sent_tokenize
+from models.document import Snippet
+from services.document_service import DocumentService
+from services.translation_service import TranslationService
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class MetaDataService(DocumentService):
+    """Classifies the text of documents without a PDF, i.e. their ReliefWeb body."""
+
+    @classmethod
+    def process_body(cls, session, doc_id: str):
+        doc = cls._get_document_by_id(session, doc_id)
+        doc.processed = True
+        doc.failed = True
+        session.add(doc)
+        session.commit()
+
+        if doc.document_text:
+            sentences = sent_tokenize(doc.document_text)
+        else:
+            sentences = []
+
+        if doc.language_iso3 != cls.ISO3_ENG:
+            aws_translate = get_translation_service()
+            doc.title_translated = cls._translate_text(doc.title, doc.language_iso3, aws_translate)
+            sentences = TranslationService.translate_many(sentences, doc.language_iso3, aws_translate)
+        with metrics.span("segment"):
+            snipeds = list(cls.SEGMENTER.segment(cls.SEGMENTER.measure(sentences)))
+
+        predicted_scores = predict_scores_batch(snipeds)
+        predicted_classes = [labels_from_scores(scores) for scores in predicted_scores]
+        doc.text_translated, doc_stat = cls._tag_text(snipeds, predicted_classes)
+        if doc_stat.items():
+            doc.model_classification = ", ".join(f"{key} - {value}" for key, value in doc_stat.items())
+        if doc.language_iso3 != cls.ISO3_ENG:
+            doc.translated = True
+        doc.failed = False
+        session.add(doc)
+        cls._save_snippets(
+            session,
+            doc.id,
+            [
+                dict(text=sniped, labels=keys, scores=scores)
+                for sniped, keys, scores in zip(snipeds, predicted_classes, predicted_scores)
+            ],
+        )
+        with metrics.span("db_commit"):
+            session.commit()
+
+    @classmethod
+    def rerender(cls, session, doc, threshold: float) -> None:
+        """Tag the translated text of an already processed document again, labelling its snippets from their stored
+        scores. Snippets stored without scores keep their labels."""
+        rows = session.execute(
+            select(Snippet.snippet_text, Snippet.snippet_classification, Snippet.snippet_scores)
+            .where(Snippet.record_id == doc.id)
+            .order_by(Snippet.id)
+        ).all()
+        doc.text_translated, _ = cls._tag_text(
+            [text for text, _, _ in rows],
+            [labels_from_scores(scores, threshold) if scores else labels or [] for _, labels, scores in rows],
+        )
+        session.add(doc)
+
+    @staticmethod
+    def _tag_text(snipeds: List[str], predicted_classes: List[List[str]]) -> Tuple[str, dict]:
+        doc_stat: dict = defaultdict(lambda: 0)
+        res = ""
+        for sniped, meta_keys in zip(snipeds, predicted_classes):
+            if meta_keys:
+                keys_tag = ""
+                for meta_key in meta_keys:
+                    doc_stat[meta_key] += 1
+                    keys_tag += f"#{meta_key}_framework, "
+                res += f"<br>({keys_tag}) {sniped}</br>"
+            else:
+                res += f" {sniped}"
+        return res, doc_stat
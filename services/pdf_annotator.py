@@ -0,0 +1,95 @@
+from bisect import bisect_left, bisect_right
+from typing import List, Optional
+
+import fitz
+
+from services.text_fitter import TextFitter
+
+
+class PageAnnotator:
+    """Collects the re-typeset blocks and the snippet tags of an annotated page and draws all of them with a single
+    shape commit. Rects go first and text last, so tag highlights never cover the text."""
+
+    BORDER_COLOR = (1, 1, 1)
+    TEXT_COLOR = (0, 0, 0)
+    TAG_COLOR = (1, 0, 0)
+    TAG_FILL_COLOR = (1, 1, 0)
+    TAG_FONT_SIZE = 10
+    FITTER = TextFitter()
+
+    def __init__(self, page):
+        self.page = page
+        self.blocks: List[tuple] = []
+        self.tags: List[tuple] = []
+
+    @staticmethod
+    def snippet_bboxes(block_bbox: tuple, block_text: str, snipeds: List[str]) -> List[tuple]:
+        """Split the block bbox into horizontal bands, one per snippet, sized after the snippet share of the text.
+        Snippets are consecutive sentences of the block, so the bands follow the re-typeset text."""
+        x0, y0, x1, y1 = block_bbox
+        text_size = max(len(block_text), 1)
+        bboxes = []
+        start = 0
+        for sniped in snipeds:
+            end = min(start + len(sniped), text_size)
+            bboxes.append((x0, y0 + (y1 - y0) * start / text_size, x1, y0 + (y1 - y0) * end / text_size))
+            start = end
+        return bboxes
+
+    @staticmethod
+    def snippet_line_bboxes(block: dict, snipeds: List[str]) -> List[Optional[tuple]]:
+        """Locate the snippets of an untranslated block on its lines, as extracted by get_text("dict"): a snippet box
+        is the union of the boxes of the lines its text runs over, or None when the text is not found. Whitespace is
+        ignored when matching, as snippets join their sentences with single spaces."""
+        lines = block["lines"]
+        line_texts = ["".join("".join(span["text"] for span in line["spans"]).split()) for line in lines]
+        line_ends = []
+        block_end = 0
+        for line_text in line_texts:
+            block_end += len(line_text)
+            line_ends.append(block_end)
+        block_text = "".join(line_texts)
+
+        bboxes: List[Optional[tuple]] = []
+        cursor = 0
+        for sniped in snipeds:
+            sniped_text = "".join(sniped.split())
+            start = block_text.find(sniped_text, cursor) if sniped_text else -1
+            if start < 0:
+                bboxes.append(None)
+                continue
+            cursor = start + len(sniped_text)
+            first, end = bisect_right(line_ends, start), bisect_left(line_ends, cursor) + 1
+            rect = fitz.Rect()
+            for line in lines[first:end]:
+                rect |= line["bbox"]
+            bboxes.append(tuple(rect))
+        return bboxes
+
+    def add_block(self, bbox: tuple, text: str, font_size: float) -> None:
+        self.blocks.append((fitz.Rect(bbox), text, font_size))
+
+    def add_tag(self, bbox: tuple, keys: List[str]) -> None:
+        keys_tag = "".join(f"#{meta_key}_framework, " for meta_key in keys)
+        self.tags.append((fitz.Rect(bbox), keys_tag))
+
+    def commit(self) -> None:
+        shape = self.page.new_shape()
+        if self.blocks:
+            for rect, _, _ in self.blocks:
+                shape.draw_rect(rect)
+            shape.finish(color=self.BORDER_COLOR)
+        if self.tags:
+            for rect, _ in self.tags:
+                shape.draw_rect(rect)
+            shape.finish(color=self.BORDER_COLOR, fill=self.TAG_FILL_COLOR)
+
+        for rect, text, font_size in self.blocks:
+            font_size = self.FITTER.fit(rect, text, font_size, lineheight=1)
+            if font_size:
+                shape.insert_textbox(rect, text, fontsize=font_size, color=self.TEXT_COLOR, lineheight=1)
+        for rect, keys_tag in self.tags:
+            font_size = self.FITTER.fit(rect, keys_tag, self.TAG_FONT_SIZE)
+            if font_size:
+                shape.insert_textbox(rect, keys_tag, fontsize=font_size, color=self.TAG_COLOR)
+        shape.commit()
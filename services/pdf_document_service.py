@@ -1,28 +1,28 @@
 import io
 import logging
+import threading
 import uuid
-from typing import List
+from typing import Callable, Tuple
 from dotenv import load_dotenv
 
-import requests
 import fitz
 from collections import defaultdict
-from sqlalchemy import select, and_
-from nltk import download as nltk_download
-from nltk import data as nltk_data
-from nltk.tokenize import sent_tokenize, word_tokenize
+from sqlalchemy import select
 
-from infrastructure import config
+from infrastructure import config, metrics
 from infrastructure.aws import (
-    send_to_sqs,
     get_s3,
     get_translation_service,
-    predict_classes,
-    send_email,
+    labels_from_scores,
+    predict_scores_batch,
 )
-from infrastructure.db import Session
-from models.document import Document
-from services.air_table_service import AirTableService
+from infrastructure.download import download_file, DownloadedFile
+from infrastructure.utils import ordered_map
+from models.document import Box, Snippet
+from infrastructure.tokenizer import sent_tokenize
+from services.document_service import DocumentService
+from services.pdf_annotator import PageAnnotator
+from services.translation_service import TranslationService
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -30,201 +30,29 @@ logger.setLevel(logging.INFO)
 load_dotenv()
 
 
-class PDFDocumentService:
+class PDFDocumentService(DocumentService):
     S3_INPUT_BUCKET_NAME = "acaps-sofia-input-pdfs"
     S3_PROCESSED_BUCKET_NAME = "acaps-sofia-output-pdfs"
-    PROCESSING_DOCUMENTS_PDF_SQS_QUEUE = "processing-documents-pdf"
-    PROCESSING_DOCUMENTS_META_SQS_QUEUE = "processing-documents-meta-data"
-    ISO3_ENG = "en"
-    TEXT_TRANSLATION_TYPES = ["Infographic", "Map", "Interactive", "Other"]
-    DAY_PROCESSING_LIMIT = 150
-    MIN_TEXT_BLOCK = 20
-    MAX_SNIPED_SIZE = 80
+    # PyMuPDF is not thread-safe and documents of an SQS batch are processed concurrently, so fitz is only used
+    # while holding this lock
+    FITZ_LOCK = threading.RLock()
+    # fitted down from there, as when the original font size of the block is unknown
+    STORED_SNIPPET_FONT_SIZE = 11.0
 
     @classmethod
-    def make_tasks_for_processing(cls):
-        unprocessed_documents = cls._get_unprocessed_documents()
-        logger.info(unprocessed_documents)
-        num_doc_to_process = len(unprocessed_documents)
-        num_pdf = 0
-        num_not_pdf = 0
-        for document in unprocessed_documents:
-            logger.info(f"doc: {document.id}")
-            if document.format in cls.TEXT_TRANSLATION_TYPES or not document.attachment_link:
-                send_to_sqs(
-                    topic_name=cls.PROCESSING_DOCUMENTS_META_SQS_QUEUE,
-                    message=str(document.id),
-                )
-                num_not_pdf += 1
-            else:
-                send_to_sqs(
-                    topic_name=cls.PROCESSING_DOCUMENTS_PDF_SQS_QUEUE,
-                    message=str(document.id),
-                )
-                num_pdf += 1
-        # return log info
-        message = (
-            f"{num_doc_to_process} documents sent to be processed.\n"
-            f"{num_pdf} documents have a pdf. {num_not_pdf} documents do not have a pdf. "
-        )
-        logger.info(message)
-        send_email(message)
-
-    @classmethod
-    def _get_unprocessed_documents(cls) -> List[Document]:
-        session = Session()
-        res = session.execute(select(Document).filter(Document.processed.is_(False)).limit(cls.DAY_PROCESSING_LIMIT))
-        return res.scalars().all()
-
-    @staticmethod
-    def _get_document_by_id(doc_id: str) -> Document:
-        session = Session()
-        query = select(Document).filter(Document.id == int(doc_id))
-        res = session.execute(query).scalar_one()
-        return res
-
-    @classmethod
-    def process_document(cls, doc_id: str):
-        nltk_data.path.append("/tmp")
-        nltk_download("punkt", download_dir="/tmp")
-        session = Session()
+    def process_document(cls, session, doc_id: str):
         doc_name = uuid.uuid4()
-        doc = cls._get_document_by_id(doc_id)
+        doc = cls._get_document_by_id(session, doc_id)
         doc.processed = True
         doc.failed = True
         session.add(doc)
         session.commit()
 
-        original_pdf_bytes = requests.get(doc.attachment_link).content
-        # cls._put_document_to_s3(original_pdf_bytes, f"{doc_name}.pdf", cls.S3_INPUT_BUCKET_NAME)
-        pdf_document = fitz.open("pdf", stream=io.BytesIO(original_pdf_bytes))
-        res_pdf_document = fitz.open("pdf", stream=io.BytesIO(original_pdf_bytes))
-
         aws_translate = get_translation_service()
-
-        gold_color_to_mark = (1, 1, 0)
-        doc_stat: dict = defaultdict(lambda: 0)
-
-        p_no = 0
-        for page in pdf_document:
-            blocks = page.get_text("dict")["blocks"]
-
-            new_page = res_pdf_document.new_page(pno=p_no + 1)
-            shape = new_page.new_shape()  # create Shape
-            page_tags = []
-
-            for block in blocks:
-                if block["type"] == 0:
-                    block_text = ""
-                    font_size = 11.0
-
-                    for block_line in block["lines"]:
-                        line_text = "".join(i["text"] for i in block_line["spans"])
-                        block_text += f" {line_text}"
-                        block_font_size = block_line["spans"][0]["size"]
-                        font_size = block_font_size if 7 < block_font_size < font_size else font_size
-
-                    if doc.language_iso3 != cls.ISO3_ENG and block_text:
-                        block_text = cls._translate_text(block_text, doc.language_iso3, aws_translate)
-
-                    if len(word_tokenize(block_text)) > cls.MIN_TEXT_BLOCK:
-                        sentences = sent_tokenize(block_text)
-                        processed_sent_count = 0
-                        sniped = ""
-                        while processed_sent_count < len(sentences):
-                            cur_sent = sentences[processed_sent_count]
-                            if len(word_tokenize(sniped)) + len(word_tokenize(cur_sent)) <= cls.MAX_SNIPED_SIZE:
-                                sniped += f" {cur_sent}"
-                                processed_sent_count += 1
-                            elif not sniped and len(word_tokenize(cur_sent)) > cls.MAX_SNIPED_SIZE:
-                                sniped += f" {cur_sent}"
-                                processed_sent_count += 1
-                            else:
-                                new_keys = predict_classes(sniped)
-                                if new_keys:
-                                    page_tags.append(dict(keys=new_keys, sniped=sniped))
-                                sniped = ""
-
-                        if len(word_tokenize(sniped)) >= cls.MIN_TEXT_BLOCK:
-                            new_keys = predict_classes(sniped)
-                            if new_keys:
-                                page_tags.append(dict(keys=new_keys, sniped=sniped))
-                            sniped = ""
-
-                    new_rect = fitz.Rect(
-                        block["bbox"][0],
-                        block["bbox"][1],
-                        block["bbox"][2],
-                        block["bbox"][3],
-                    )
-                    shape.draw_rect(new_rect)
-
-                    # if meta_keys:
-                    #     shape.finish(color=(1, 1, 1), fill=gold_color_to_mark)
-                    # else:
-                    shape.finish(color=(1, 1, 1))
-                    rc = -1
-
-                    while font_size > 0 and rc < 0:
-                        rc = shape.insert_textbox(
-                            new_rect,
-                            block_text,
-                            fontsize=font_size,
-                            color=(0, 0, 0),
-                            lineheight=1,
-                        )
-                        font_size -= 0.1
-
-                    for tagged_sniped in page_tags:
-                        keys_tag = ""
-                        for meta_key in tagged_sniped["keys"]:
-                            doc_stat[meta_key] += 1
-                            keys_tag += f"#{meta_key}_framework, "
-                        place_to_fill = new_page.search_for(tagged_sniped["sniped"])
-                        if len(place_to_fill) > 0:
-                            tagged_rect = fitz.Rect(
-                                place_to_fill[0].x0,
-                                place_to_fill[0].y0,
-                                place_to_fill[0].x1,
-                                place_to_fill[0].y1,
-                            )
-                            shape.draw_rect(tagged_rect)
-                            rc = -1
-                            font_size = 10
-                            while font_size > 0 and rc < 0:
-                                rc = new_page.insert_textbox(
-                                    tagged_rect,
-                                    keys_tag,
-                                    fontsize=font_size,
-                                    color=(1, 0, 0),
-                                )
-                                font_size -= 0.2
-
-                            shape.finish(color=(1, 1, 1), fill=gold_color_to_mark)
-                        else:
-                            tagged_rect = fitz.Rect(
-                                block["bbox"][0],
-                                block["bbox"][1],
-                                block["bbox"][2],
-                                block["bbox"][3],
-                            )
-                            shape.draw_rect(tagged_rect)
-                            rc = -1
-                            font_size = 10
-                            while font_size > 0 and rc < 0:
-                                rc = new_page.insert_textbox(
-                                    tagged_rect,
-                                    keys_tag,
-                                    fontsize=font_size,
-                                    color=(1, 0, 0),
-                                )
-                                font_size -= 0.2
-                            shape.finish(color=(1, 1, 1), fill=gold_color_to_mark)
-            shape.commit()
-
-            p_no += 2
-
-        s3_link = cls._put_document_to_s3(res_pdf_document.write(), f"{doc_name}.pdf", cls.S3_PROCESSED_BUCKET_NAME)
+        res_pdf_bytes, doc_stat, snippets = cls._annotate_pdf(
+            doc.attachment_link, doc.language_iso3, aws_translate, predict_scores_batch, config.CLASSIFICATION_THRESHOLD
+        )
+        s3_link = cls._put_document_to_s3(res_pdf_bytes, f"{doc_name}.pdf", cls.S3_PROCESSED_BUCKET_NAME)
         doc.modified_pdf_link = s3_link
         if doc.language_iso3 != cls.ISO3_ENG:
             doc.title_translated = cls._translate_text(doc.title, doc.language_iso3, aws_translate)
@@ -235,74 +63,167 @@ class PDFDocumentService:
             doc.model_classification = ", ".join(f"{key} - {value}" for key, value in doc_stat.items())
         doc.failed = False
         session.add(doc)
-        session.commit()
+        cls._save_snippets(session, doc.id, snippets)
+        with metrics.span("db_commit"):
+            session.commit()
 
     @classmethod
-    def process_body(cls, doc_id: str):
-        nltk_data.path.append("/tmp")
-        nltk_download("punkt", download_dir="/tmp")
-
-        session = Session()
-        doc = cls._get_document_by_id(doc_id)
-        doc.processed = True
-        doc.failed = True
+    def rerender(cls, session, doc, threshold: float) -> None:
+        """Annotate the PDF of an already processed document again from its stored snippets and boxes, labelling
+        them from their stored scores, or keeping their labels when they have none. Only the original PDF is fetched:
+        the annotation pages show the stored snippet texts in their boxes, so nothing is extracted, translated or
+        classified again. Blocks without stored snippets, those under MIN_TEXT_BLOCK tokens such as headings and
+        captions, are left out of the annotation pages."""
+        rows = session.execute(
+            select(Box.page, Box.location, Snippet.snippet_text, Snippet.snippet_classification, Snippet.snippet_scores)
+            .join(Snippet, Box.snippet_id == Snippet.id)
+            .where(Snippet.record_id == doc.id)
+            .order_by(Box.page, Snippet.id)
+        )
+        page_snippets: dict = defaultdict(list)
+        for page, location, text, labels, scores in rows:
+            page_snippets[page].append((location, text, labels_from_scores(scores, threshold) if scores else labels))
+
+        with download_file(doc.attachment_link) as downloaded, cls.FITZ_LOCK:
+            res_pdf_document = cls._open_pdf(downloaded)
+            for p_no in range(res_pdf_document.page_count):
+                cls._render_stored_page(res_pdf_document, 2 * p_no + 1, page_snippets.get(p_no, []))
+            res_pdf_bytes = res_pdf_document.write()
+            res_pdf_document.close()
+        s3_link = cls._put_document_to_s3(res_pdf_bytes, f"{uuid.uuid4()}.pdf", cls.S3_PROCESSED_BUCKET_NAME)
+        doc.modified_pdf_link = s3_link
         session.add(doc)
-        session.commit()
 
+    @classmethod
+    def _annotate_pdf(
+        cls, attachment_link: str, language_iso3: str, aws_translate, score: Callable, threshold: float
+    ) -> Tuple[bytes, dict, list]:
+        """Return the annotated PDF, the label counts and the snippets of the document at `attachment_link`.
+        `score` maps snippet texts to their model scores."""
         doc_stat: dict = defaultdict(lambda: 0)
+        snippets: list = []
+        with download_file(attachment_link) as downloaded:
+            with cls.FITZ_LOCK:
+                pdf_document = cls._open_pdf(downloaded)
+                res_pdf_document = cls._open_pdf(downloaded)
+                page_count = pdf_document.page_count
+
+            # Pages are extracted and rendered in this thread, only translation and classification run in the pool.
+            analysed_pages = ordered_map(
+                lambda page_content: cls._analyse_page(page_content, language_iso3, aws_translate, score, threshold),
+                (cls._extract_page(pdf_document, pno) for pno in range(page_count)),
+                max_workers=config.PAGE_PIPELINE_WORKERS,
+                max_in_flight=config.PAGE_PIPELINE_MAX_IN_FLIGHT,
+            )
+            for p_no, page_content in enumerate(analysed_pages):
+                with metrics.span("render"), cls.FITZ_LOCK:
+                    cls._render_page(res_pdf_document, 2 * p_no + 1, page_content, doc_stat)
+                snippets.extend(dict(snippet, page=p_no) for snippet in page_content["snippets"])
 
-        if doc.document_text:
-            sentences = sent_tokenize(doc.document_text)
-        else:
-            sentences = []
+            with metrics.span("write_pdf"), cls.FITZ_LOCK:
+                res_pdf_bytes = res_pdf_document.write()
+                pdf_document.close()
+                res_pdf_document.close()
+        return res_pdf_bytes, doc_stat, snippets
 
-        if doc.language_iso3 != cls.ISO3_ENG:
-            aws_translate = get_translation_service()
-            doc.title_translated = cls._translate_text(doc.title, doc.language_iso3, aws_translate)
-            translated_sentences = []
-            for sentence in sentences:
-                translated_sentences.append(cls._translate_text(sentence, doc.language_iso3, aws_translate))
-            sentences = translated_sentences
-        processed_sent_count = 0
-        sniped = ""
-        res = ""
-        while processed_sent_count < len(sentences):
-            cur_sent = sentences[processed_sent_count]
-            if len(word_tokenize(sniped)) + len(word_tokenize(cur_sent)) <= cls.MAX_SNIPED_SIZE:
-                sniped += f" {cur_sent}"
-                processed_sent_count += 1
-            elif not sniped and len(word_tokenize(cur_sent)) > cls.MAX_SNIPED_SIZE:
-                sniped += f" {cur_sent}"
-                processed_sent_count += 1
+    @staticmethod
+    def _open_pdf(downloaded: DownloadedFile):
+        # Opening from the spooled file lets MuPDF read pages on demand instead of holding a copy in memory.
+        if downloaded.path:
+            return fitz.open(downloaded.path, filetype="pdf")
+        return fitz.open("pdf", stream=downloaded.data)
+
+    @classmethod
+    @metrics.timed("extract")
+    def _extract_page(cls, pdf_document, pno: int) -> dict:
+        with cls.FITZ_LOCK:
+            page_dict = pdf_document.load_page(pno).get_text("dict")
+        blocks = [block for block in page_dict["blocks"] if block["type"] == 0]
+        block_texts = []
+        font_sizes = []
+        for block in blocks:
+            block_text = ""
+            font_size = 11.0
+
+            for block_line in block["lines"]:
+                line_text = "".join(i["text"] for i in block_line["spans"])
+                block_text += f" {line_text}"
+                block_font_size = block_line["spans"][0]["size"]
+                font_size = block_font_size if 7 < block_font_size < font_size else font_size
+            block_texts.append(block_text)
+            font_sizes.append(font_size)
+        return dict(blocks=blocks, block_texts=block_texts, font_sizes=font_sizes)
+
+    @classmethod
+    def _analyse_page(
+        cls, page_content: dict, language_iso3: str, aws_translate, score: Callable, threshold: float
+    ) -> dict:
+        block_texts = page_content["block_texts"]
+        translated = language_iso3 != cls.ISO3_ENG
+        if translated:
+            block_texts = TranslationService.translate_many(block_texts, language_iso3, aws_translate)
+
+        block_snipeds = []
+        for block_text in block_texts:
+            sized_sentences = cls.SEGMENTER.measure(sent_tokenize(block_text))
+            if sum(size for _, size in sized_sentences) > cls.MIN_TEXT_BLOCK:
+                block_snipeds.append(list(cls.SEGMENTER.segment(sized_sentences)))
             else:
-                meta_keys = predict_classes(sniped)
-                if meta_keys:
-                    keys_tag = ""
-                    for meta_key in meta_keys:
-                        doc_stat[meta_key] += 1
-                        keys_tag += f"#{meta_key}_framework, "
-                    res += f"<br>({keys_tag}) {sniped}</br>"
-                else:
-                    res += f" {sniped}"
-                sniped = ""
-        if len(word_tokenize(sniped)) >= cls.MIN_TEXT_BLOCK:
-            meta_keys = predict_classes(sniped)
-            if meta_keys:
-                keys_tag = ""
-                for meta_key in meta_keys:
+                block_snipeds.append([])
+
+        # the whole page is classified with a single batch
+        predicted_scores = iter(score([sniped for snipeds in block_snipeds for sniped in snipeds]))
+        block_tags = []
+        snippets = []
+        for block, block_text, snipeds in zip(page_content["blocks"], block_texts, block_snipeds):
+            tags = []
+            for sniped, bbox in zip(snipeds, cls._snippet_bboxes(block, block_text, snipeds, translated)):
+                scores = next(predicted_scores)
+                new_keys = labels_from_scores(scores, threshold)
+                if new_keys:
+                    tags.append(dict(keys=new_keys, sniped=sniped, bbox=bbox))
+                snippets.append(dict(text=sniped, labels=new_keys, scores=scores, bbox=bbox))
+            block_tags.append(tags)
+        return dict(page_content, block_texts=block_texts, block_tags=block_tags, snippets=snippets)
+
+    @classmethod
+    def _render_stored_page(cls, res_pdf_document, pno: int, snippets: list) -> None:
+        annotator = PageAnnotator(res_pdf_document.new_page(pno=pno))
+        previous = None
+        for location, text, labels in snippets:
+            bbox = fitz.Rect(location)
+            # line boxes of consecutive snippets share the line where one ends and the next starts, the box is only
+            # moved below the previous one when it keeps some height
+            if previous is not None and bbox.intersects(previous) and previous.y1 < bbox.y1:
+                bbox.y0 = max(bbox.y0, previous.y1)
+            if bbox.is_empty:
+                continue
+            annotator.add_block(bbox, text.strip(), cls.STORED_SNIPPET_FONT_SIZE)
+            if labels:
+                annotator.add_tag(bbox, labels)
+            previous = bbox
+        annotator.commit()
+
+    @staticmethod
+    def _snippet_bboxes(block: dict, block_text: str, snipeds: list, translated: bool) -> list:
+        # translated text can't be matched to the original lines, so its snippets get an estimated band of the block
+        bands = PageAnnotator.snippet_bboxes(block["bbox"], block_text, snipeds)
+        if translated:
+            return bands
+        return [line_bbox or band for line_bbox, band in zip(PageAnnotator.snippet_line_bboxes(block, snipeds), bands)]
+
+    @classmethod
+    def _render_page(cls, res_pdf_document, pno: int, page_content: dict, doc_stat: dict) -> None:
+        annotator = PageAnnotator(res_pdf_document.new_page(pno=pno))
+        for block, block_text, font_size, block_tags in zip(
+            page_content["blocks"], page_content["block_texts"], page_content["font_sizes"], page_content["block_tags"]
+        ):
+            annotator.add_block(block["bbox"], block_text, font_size)
+            for tagged_sniped in block_tags:
+                for meta_key in tagged_sniped["keys"]:
                     doc_stat[meta_key] += 1
-                    keys_tag += f"#{meta_key}_framework, "
-                res += f"<br>({keys_tag}) {sniped}</br>"
-            else:
-                res += f" {sniped}"
-        doc.text_translated = res
-        if doc_stat.items():
-            doc.model_classification = ", ".join(f"{key} - {value}" for key, value in doc_stat.items())
-        if doc.language_iso3 != cls.ISO3_ENG:
-            doc.translated = True
-        doc.failed = False
-        session.add(doc)
-        session.commit()
+                annotator.add_tag(tagged_sniped["bbox"], tagged_sniped["keys"])
+        annotator.commit()
 
     # @classmethod
     # def upser_example(cls, doc_id: int, s3_link: str):
@@ -316,71 +237,7 @@ class PDFDocumentService:
     @classmethod
     def _put_document_to_s3(cls, content: bytes, doc_title: str, bucket_name: str) -> str:
         s3 = get_s3()
-        s3.upload_fileobj(io.BytesIO(content), bucket_name, f"{doc_title}")
+        metrics.count("s3")
+        with metrics.span("s3_upload"):
+            s3.upload_fileobj(io.BytesIO(content), bucket_name, f"{doc_title}")
         return f"https://{bucket_name}.s3.{config.AWS_REGION}.amazonaws.com/{doc_title}"
-
-    @classmethod
-    def _translate_text(cls, text: str, iso3_lang: str = "auto", aws_translate=None):
-        if not aws_translate:
-            aws_translate = get_translation_service()
-        try:
-            response = aws_translate.translate_text(
-                Text=text,
-                TerminologyNames=[],
-                SourceLanguageCode="auto",
-                TargetLanguageCode=cls.ISO3_ENG,
-                Settings={
-                    "Formality": "FORMAL",
-                    # "Profanity": "MASK"
-                },
-            )
-        except Exception:
-            try:
-                response = aws_translate.translate_text(
-                    Text=text,
-                    TerminologyNames=[],
-                    SourceLanguageCode=iso3_lang,
-                    TargetLanguageCode=cls.ISO3_ENG,
-                    Settings={
-                        "Formality": "FORMAL",
-                        # "Profanity": "MASK"
-                    },
-                )
-            except Exception:
-                return "Can't translate the text"
-        return response.get("TranslatedText", "")
-
-    @classmethod
-    def update_air_table(cls):
-        session = Session()
-        res = session.execute(
-            select(Document).filter(and_(Document.synchronized.is_(False)), Document.processed.is_(True))
-        )
-        documents = res.scalars().all()
-        batch_for_sync = []
-        num_sync_airtable = len(documents)
-        for document in documents:
-            batch_for_sync.append(document)
-
-            if len(batch_for_sync) == AirTableService.BATCH_MAX_COUNT:
-                updater_res = AirTableService.create_records(batch_for_sync)
-
-                if updater_res:
-                    for synced_doc in batch_for_sync:
-                        synced_doc.synchronized = True
-                        session.add(synced_doc)
-                    session.commit()
-
-                batch_for_sync = []
-
-        if len(batch_for_sync):
-            updater_res = AirTableService.create_records(batch_for_sync)
-            if updater_res:
-                for synced_doc in batch_for_sync:
-                    synced_doc.synchronized = True
-                    session.add(synced_doc)
-                session.commit()
-                # return logged info
-                message = f"Doc sync to AirTable base: {num_sync_airtable} docs were synced to Airtable."
-                logger.info(message)
-                send_email(message)
@@ -0,0 +1,122 @@
+import logging
+import time
+import traceback
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import Integer, any_, bindparam, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from infrastructure.aws import LABELS
+from infrastructure.db import keyset_pages
+from infrastructure.utils import chunked
+from models.document import Document, Snippet
+from services.meta_data_service import MetaDataService
+from services.pdf_document_service import PDFDocumentService
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class ReclassifyService:
+    """Recomputes snippet labels and document classifications for a new threshold from the stored model scores,
+    without calling the endpoint."""
+
+    PAGE_SIZE = 20_000
+    DOCUMENT_BATCH_SIZE = 1000
+
+    @classmethod
+    def reclassify(
+        cls, session, threshold: float, record_ids: Optional[List[int]] = None, render: bool = False
+    ) -> dict:
+        """Relabel the scored snippets of `record_ids`, or of every document, and update the model classification
+        of their documents. With `render`, annotated PDFs and tagged texts are made again too, which downloads the
+        PDFs and takes far longer, so it is meant for a few documents at a time."""
+        start = time.perf_counter()
+        # scores are selected as plain columns, psycopg2 parses floats much faster than arrays
+        statement = select(
+            Snippet.id, Snippet.record_id, *[Snippet.snippet_scores[index + 1] for index in range(len(LABELS))]
+        ).where(Snippet.snippet_scores.is_not(None))
+        if record_ids:
+            statement = statement.where(Snippet.record_id.in_(record_ids))
+
+        labels = np.array(LABELS)
+        label_counts: Dict[int, np.ndarray] = {}
+        snippet_count = 0
+        date_classified = datetime.now(tz=timezone.utc)
+        label_bits = 1 << np.arange(len(LABELS))
+        for rows in keyset_pages(session, statement, Snippet.id, cls.PAGE_SIZE):
+            values = np.array([tuple(row) for row in rows], dtype=float)
+            snippet_ids, doc_ids = values[:, 0].astype(np.int64), values[:, 1].astype(np.int64)
+            positives = values[:, 2:] >= threshold
+
+            # a handful of distinct label sets, so one UPDATE per set instead of one per snippet, leaving unchanged
+            # snippets alone
+            label_set_codes = positives @ label_bits
+            for code in np.unique(label_set_codes).tolist():
+                set_labels = labels[(code & label_bits) > 0].tolist()
+                set_snippet_ids = bindparam(
+                    "snippet_ids", snippet_ids[label_set_codes == code].tolist(), ARRAY(Integer)
+                )
+                session.execute(
+                    update(Snippet)
+                    .where(
+                        Snippet.id == any_(set_snippet_ids),
+                        Snippet.snippet_classification.is_distinct_from(set_labels),
+                    )
+                    .values(snippet_classification=set_labels, date_classified=date_classified),
+                    execution_options={"synchronize_session": False},
+                )
+
+            page_doc_ids, doc_indexes = np.unique(doc_ids, return_inverse=True)
+            page_counts = np.zeros((len(page_doc_ids), len(LABELS)), dtype=int)
+            np.add.at(page_counts, doc_indexes.reshape(-1), positives)
+            for doc_id, counts in zip(page_doc_ids.tolist(), page_counts):
+                label_counts[doc_id] = label_counts[doc_id] + counts if doc_id in label_counts else counts
+            snippet_count += len(rows)
+            session.commit()
+
+        for doc_ids_chunk in chunked(label_counts, cls.DOCUMENT_BATCH_SIZE):
+            session.execute(
+                update(Document),
+                [
+                    dict(id=doc_id, model_classification=cls._model_classification(label_counts[doc_id]))
+                    for doc_id in doc_ids_chunk
+                ],
+            )
+            session.commit()
+
+        stats = dict(
+            threshold=threshold,
+            documents=len(label_counts),
+            snippets=snippet_count,
+            seconds=round(time.perf_counter() - start, 2),
+        )
+        if render:
+            stats.update(cls._render(session, list(label_counts), threshold))
+        logger.info(f"Reclassification stats: {stats}")
+        return stats
+
+    @staticmethod
+    def _model_classification(counts: np.ndarray) -> Optional[str]:
+        # same format as the processors, labels in MODELS order
+        return ", ".join(f"{label} - {count}" for label, count in zip(LABELS, counts.tolist()) if count) or None
+
+    @classmethod
+    def _render(cls, session, doc_ids: List[int], threshold: float) -> dict:
+        rendered, failed = 0, 0
+        for doc_id in doc_ids:
+            doc = session.get(Document, doc_id)
+            try:
+                if doc.modified_pdf_link:
+                    PDFDocumentService.rerender(session, doc, threshold)
+                else:
+                    MetaDataService.rerender(session, doc, threshold)
+                session.commit()
+                rendered += 1
+            except Exception:
+                session.rollback()
+                logger.error(f"Could not render document {doc_id}: {traceback.format_exc()}")
+                failed += 1
+        return dict(rendered=rendered, render_failures=failed)
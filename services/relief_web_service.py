@@ -1,108 +1,233 @@
 import json
 from datetime import datetime, timedelta, timezone
-
-import requests
+from typing import Iterator, List, Optional, Tuple
 
 import logging
+from sqlalchemy import literal_column
+from sqlalchemy.dialects.postgresql import insert
+
+from infrastructure import metrics
 from infrastructure.aws import send_to_sqs, send_email
-from infrastructure.db import Session
+from infrastructure.config import RELIEF_WEB_API_URL
+from infrastructure.http import get_http_session
+from infrastructure.utils import chunked, ordered_map
 from models.document import Document
-from services.air_table_service import AirTableService
+from models.scraper_watermark import ScraperWatermark
+from services.country_service import CountryService
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
 class ReliefWebService:
-    URL = "https://api.reliefweb.int/v1/reports?appname=ACAPS_scraper"
+    URL = f"{RELIEF_WEB_API_URL}/reports?appname=ACAPS_scraper"
     DEFAULT_RETRIEVED_DAYS = 1
+    DAILY_WATERMARK = "relief_web"
+    # reports can show up in the API some time after their creation date, they are re-fetched and upserted again
+    WATERMARK_OVERLAP = timedelta(hours=6)
+    BACKFILL_CHUNK = timedelta(days=7)
     PARSE_COMPLETED_NOTIFICATION_SQS_QUEUE = "processing-documents"
+    BATCH_SIZE = 1000
+    MAX_PAGE_WORKERS = 4
+    REQUEST_TIMEOUT = (10, 120)
+    UPSERT_BATCH_SIZE = 500
+    UPSERT_UPDATED_COLUMNS = [
+        "source_name",
+        "format",
+        "date_relief_web",
+        "date_published",
+        "source_link",
+        "document_text",
+        "relief_web_link",
+        "attachment_link",
+        "language",
+        "iso3_multiple",
+        "disaster_type",
+        "disaster_name",
+        "disaster_glide_code",
+        "theme_relief_web",
+        "title",
+        "language_iso3",
+        "iso3",
+    ]
 
     @classmethod
-    def scrap_week_data(cls):
-        retrieve_data_from = (
-            (datetime.now(tz=timezone.utc) - timedelta(days=cls.DEFAULT_RETRIEVED_DAYS))
-            .replace(microsecond=0)
-            .isoformat()
+    def scrap_week_data(cls, session):
+        """Scrape the reports created since the last run, or over the last DEFAULT_RETRIEVED_DAYS on the first one."""
+        default_from = (datetime.now(tz=timezone.utc) - timedelta(days=cls.DEFAULT_RETRIEVED_DAYS)).replace(
+            microsecond=0
         )
-        iso3_countries = AirTableService.get_iso3()
+        iso3_countries = CountryService.get_iso3(session)
         iso3_countries = iso3_countries  # + ["wld"]
 
-        relief_web_json = cls._get_data(retrieve_data_from, iso3_countries)
-        session = Session()
-        num_relief_web_doc = len(relief_web_json)
-        for doc in relief_web_json:
-            doc_info = doc.get("fields")
-            new_doc = Document(
-                source_name=doc_info.get("source")[0].get("name"),
-                format=doc_info.get("format")[0].get("name"),
-                date_relief_web=doc_info.get("date").get("created"),
-                date_published=doc_info.get("date").get("original"),
-                source_link=doc_info.get("origin"),
-                document_text=doc_info.get("body"),
-                relief_web_link=doc_info.get("url_alias"),
-                attachment_link=doc_info.get("file")[0].get("url") if doc_info.get("file") else "",
-                date_downloaded=datetime.now(tz=timezone.utc),
-                language=doc_info.get("language")[0].get("name") if doc_info.get("language") else "",
-                iso3_multiple=[i.get("iso3") for i in doc_info.get("country", [])],
-                disaster_type=[i.get("name") for i in doc_info.get("disaster_type", [])],
-                disaster_name=[i.get("name") for i in doc_info.get("disaster", [])],
-                disaster_glide_code=[i.get("glide") for i in doc_info.get("disaster", [])],
-                theme_relief_web=[i.get("name") for i in doc_info.get("theme", [])],
-                title=doc_info.get("title"),
-                translated=False,
-                processed=False,
-                language_iso3=doc_info.get("language")[0].get("code") if doc_info.get("language") else "",
-                synchronized=False,
-                iso3=doc_info.get("primary_country").get("iso3"),
-            )
-            session.add(new_doc)
-
-        session.commit()
+        num_inserted, num_updated = cls._scrape_range(session, cls.DAILY_WATERMARK, default_from, None, iso3_countries)
         send_to_sqs(topic_name=cls.PARSE_COMPLETED_NOTIFICATION_SQS_QUEUE, message="Go")
         # return logged info
-        message = f"Reliefweb scraper success: {num_relief_web_doc} docs were scraped today."
+        message = (
+            f"Reliefweb scraper success: {num_inserted + num_updated} docs were scraped today, "
+            f"{num_inserted} new and {num_updated} already known."
+        )
         logger.info(message)
         send_email(message)
 
     @classmethod
-    def _get_data(cls, date_from, countries_iso3: list) -> list:
-        batch_size = 1000
-        f = True
-        offset = 0
-        res_data = []
-        while f:
-            request_body = cls._generate_request_body(date_from, countries_iso3)
-            response = requests.post(cls.URL, data=json.dumps(request_body))
-
-            if response.status_code != 200:
-                raise
-            else:
-                res_data.extend(response.json().get("data", []))
+    def backfill(cls, session, date_from: datetime, date_to: datetime):
+        """Scrape the reports created between two dates, BACKFILL_CHUNK at a time. Progress is saved after every
+        upserted batch, so running the same backfill again after a timeout resumes where it stopped."""
+        iso3_countries = CountryService.get_iso3(session)
+        watermark_name = f"relief_web_backfill:{date_from.isoformat()}:{date_to.isoformat()}"
+        num_inserted = 0
+        num_updated = 0
+        chunk_from = date_from
+        while chunk_from < date_to:
+            chunk_to = min(chunk_from + cls.BACKFILL_CHUNK, date_to)
+            chunk_inserted, chunk_updated = cls._scrape_range(
+                session, watermark_name, chunk_from, chunk_to, iso3_countries
+            )
+            num_inserted += chunk_inserted
+            num_updated += chunk_updated
+            chunk_from = chunk_to
+        send_to_sqs(topic_name=cls.PARSE_COMPLETED_NOTIFICATION_SQS_QUEUE, message="Go")
+        message = (
+            f"Reliefweb backfill from {date_from.isoformat()} to {date_to.isoformat()} success: "
+            f"{num_inserted + num_updated} docs were scraped, {num_inserted} new and {num_updated} already known."
+        )
+        logger.info(message)
+        send_email(message)
+
+    @classmethod
+    def _scrape_range(
+        cls, session, watermark_name: str, date_from: datetime, date_to: Optional[datetime], countries_iso3: list
+    ) -> Tuple[int, int]:
+        """Upsert the reports created from the watermark, less WATERMARK_OVERLAP, to `date_to`. Without a watermark,
+        they are scraped from `date_from`. An open range (the daily run) resumes from its watermark however far back
+        it is, so missed runs are caught up; a backfill chunk never starts before its own `date_from`. Reports come in
+        creation order and the watermark is committed with every batch."""
+        watermark = session.get(ScraperWatermark, watermark_name) or ScraperWatermark(name=watermark_name)
+        if watermark.last_created:
+            resume_from = watermark.last_created - cls.WATERMARK_OVERLAP
+            date_from = resume_from if date_to is None else max(date_from, resume_from)
+        if date_to and date_from >= date_to:
+            return 0, 0
 
-            if response.json().get("totalCount") <= offset + batch_size:
-                f = False
+        num_inserted = 0
+        num_updated = 0
+        for batch in chunked(cls._get_data(date_from, date_to, countries_iso3), cls.UPSERT_BATCH_SIZE):
+            batch_inserted, batch_updated = cls._upsert_documents(session, batch)
+            num_inserted += batch_inserted
+            num_updated += batch_updated
+            last_created = datetime.fromisoformat(batch[-1]["fields"]["date"]["created"])
+            if not watermark.last_created or last_created >= watermark.last_created:
+                watermark.last_created = last_created
+                watermark.last_relief_web_id = int(batch[-1]["id"])
+            watermark.date_updated = datetime.now(tz=timezone.utc)
+            session.add(watermark)
+            session.commit()
+        logger.info(
+            f"Scraped {watermark_name} from {date_from.isoformat()} to {date_to.isoformat() if date_to else 'now'}: "
+            f"{num_inserted} new, {num_updated} known, watermark {watermark.last_created}"
+        )
+        return num_inserted, num_updated
+
+    @classmethod
+    @metrics.timed("upsert")
+    def _upsert_documents(cls, session, relief_web_docs: List[dict]) -> Tuple[int, int]:
+        """Insert the reports, updating the metadata of reports already stored under the same ReliefWeb id.
+        Processing state is left as is, so a report is processed and synchronized only once."""
+        columns = Document.__mapper__.columns
+        num_inserted = 0
+        num_updated = 0
+        # a report can't be upserted twice in one statement
+        rows = {
+            values["relief_web_id"]: {columns[key].name: value for key, value in values.items()}
+            for values in map(cls._document_values, relief_web_docs)
+        }
+        stmt = insert(Document.__table__).values(list(rows.values()))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Document.relief_web_id],
+            set_={columns[key].name: stmt.excluded[columns[key].name] for key in cls.UPSERT_UPDATED_COLUMNS},
+        ).returning(
+            literal_column("xmax = 0")
+        )  # xmax is 0 for freshly inserted rows
+        for (is_inserted,) in session.execute(stmt):
+            if is_inserted:
+                num_inserted += 1
             else:
-                offset += batch_size
-        return res_data
+                num_updated += 1
+        return num_inserted, num_updated
+
+    @staticmethod
+    def _document_values(doc: dict) -> dict:
+        doc_info = doc.get("fields")
+        return dict(
+            relief_web_id=int(doc.get("id")),
+            source_name=doc_info.get("source")[0].get("name"),
+            format=doc_info.get("format")[0].get("name"),
+            date_relief_web=doc_info.get("date").get("created"),
+            date_published=doc_info.get("date").get("original"),
+            source_link=doc_info.get("origin"),
+            document_text=doc_info.get("body"),
+            relief_web_link=doc_info.get("url_alias"),
+            attachment_link=doc_info.get("file")[0].get("url") if doc_info.get("file") else "",
+            date_downloaded=datetime.now(tz=timezone.utc),
+            language=doc_info.get("language")[0].get("name") if doc_info.get("language") else "",
+            iso3_multiple=[i.get("iso3") for i in doc_info.get("country", [])],
+            disaster_type=[i.get("name") for i in doc_info.get("disaster_type", [])],
+            disaster_name=[i.get("name") for i in doc_info.get("disaster", [])],
+            disaster_glide_code=[i.get("glide") for i in doc_info.get("disaster", [])],
+            theme_relief_web=[i.get("name") for i in doc_info.get("theme", [])],
+            title=doc_info.get("title"),
+            translated=False,
+            processed=False,
+            language_iso3=doc_info.get("language")[0].get("code") if doc_info.get("language") else "",
+            synchronized=False,
+            iso3=doc_info.get("primary_country").get("iso3"),
+        )
+
+    @classmethod
+    def _get_data(cls, date_from: datetime, date_to: Optional[datetime], countries_iso3: list) -> Iterator[dict]:
+        """Yield the matching reports in creation order. The first page gives totalCount, the other pages are fetched
+        concurrently."""
+        http_session = get_http_session("relief_web", pool_size=cls.MAX_PAGE_WORKERS)
+        date_range = {"from": date_from.isoformat()}
+        if date_to:
+            date_range["to"] = date_to.isoformat()
+        first_page = cls._get_page(http_session, date_range, countries_iso3, 0)
+        yield from first_page.get("data", [])
+
+        offsets = range(cls.BATCH_SIZE, first_page.get("totalCount", 0), cls.BATCH_SIZE)
+        pages = ordered_map(
+            lambda offset: cls._get_page(http_session, date_range, countries_iso3, offset),
+            offsets,
+            max_workers=cls.MAX_PAGE_WORKERS,
+            max_in_flight=cls.MAX_PAGE_WORKERS,
+        )
+        for page in pages:
+            yield from page.get("data", [])
+
+    @classmethod
+    @metrics.timed("relief_web_page")
+    def _get_page(cls, http_session, date_range: dict, countries_iso3: list, offset: int) -> dict:
+        request_body = cls._generate_request_body(date_range, countries_iso3, cls.BATCH_SIZE, offset)
+        metrics.count("relief_web")
+        response = http_session.post(cls.URL, data=json.dumps(request_body), timeout=cls.REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
 
     @staticmethod
-    def _generate_request_body(date_from, countries_iso3: list, batch_size: int = 1000, offset: int = 0) -> dict:
+    def _generate_request_body(date_range: dict, countries_iso3: list, batch_size: int = 1000, offset: int = 0) -> dict:
         request_body = {
             "limit": batch_size,
             "offset": offset,
-            "preset": "latest",
+            # oldest first, so offsets stay stable while new reports come in and the watermark only moves forward
+            "sort": ["date.created:asc", "id:asc"],
             # "query": {"value": country_iso3, "fields": ["primary_country.iso3"]},
             "filter": {
                 "operator": "AND",
                 "conditions": [
                     {
                         "field": "date.created",
-                        "value": {
-                            "from": date_from
-                            # "from": "2022-12-27T00:00:00+00:00",
-                            # "to": "2023-02-20T00:00:00+00:00"
-                        },
+                        "value": date_range,
                     },
                     {"field": "source.name", "value": "ACAPS", "negate": True},
                     {
@@ -0,0 +1,33 @@
+from typing import Iterable, Iterator, List, Tuple
+
+from nltk.tokenize import word_tokenize
+
+
+class SnippetSegmenter:
+    """Groups consecutive sentences into snippets of at most `max_sniped_size` tokens.
+
+    A sentence longer than `max_sniped_size` becomes a snippet of its own, and the trailing snippet is only
+    kept when it has at least `min_text_block` tokens. Every sentence is tokenized exactly once.
+    """
+
+    def __init__(self, min_text_block: int, max_sniped_size: int):
+        self.min_text_block = min_text_block
+        self.max_sniped_size = max_sniped_size
+
+    @staticmethod
+    def measure(sentences: Iterable[str]) -> List[Tuple[str, int]]:
+        return [(sentence, len(word_tokenize(sentence, preserve_line=True))) for sentence in sentences]
+
+    def segment(self, sized_sentences: Iterable[Tuple[str, int]]) -> Iterator[str]:
+        sniped = ""
+        sniped_size = 0
+        for cur_sent, cur_sent_size in sized_sentences:
+            if sniped and sniped_size + cur_sent_size > self.max_sniped_size:
+                yield sniped
+                sniped = ""
+                sniped_size = 0
+            sniped += f" {cur_sent}"
+            sniped_size += cur_sent_size
+
+        if sniped_size >= self.min_text_block:
+            yield sniped
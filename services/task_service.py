@@ -0,0 +1,49 @@
+import logging
+from itertools import chain, islice
+from typing import Iterator
+
+from sqlalchemy import Row, select
+
+from infrastructure import config
+from infrastructure.aws import send_batch_to_sqs, send_email
+from infrastructure.db import keyset_pages
+from models.document import Document
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class TaskService:
+    PROCESSING_DOCUMENTS_PDF_SQS_QUEUE = "processing-documents-pdf"
+    PROCESSING_DOCUMENTS_META_SQS_QUEUE = "processing-documents-meta-data"
+    TEXT_TRANSLATION_TYPES = ["Infographic", "Map", "Interactive", "Other"]
+    DAY_PROCESSING_LIMIT = config.DAY_PROCESSING_LIMIT
+    TASK_PAGE_SIZE = 1000
+
+    @classmethod
+    def make_tasks_for_processing(cls, session):
+        pdf_messages = []
+        meta_messages = []
+        for document in cls._get_unprocessed_documents(session):
+            logger.info(f"doc: {document.id}")
+            if document.format in cls.TEXT_TRANSLATION_TYPES or not document.attachment_link:
+                meta_messages.append(str(document.id))
+            else:
+                pdf_messages.append(str(document.id))
+        undelivered = send_batch_to_sqs(cls.PROCESSING_DOCUMENTS_META_SQS_QUEUE, meta_messages)
+        undelivered += send_batch_to_sqs(cls.PROCESSING_DOCUMENTS_PDF_SQS_QUEUE, pdf_messages)
+        # return log info
+        message = (
+            f"{len(pdf_messages) + len(meta_messages)} documents sent to be processed.\n"
+            f"{len(pdf_messages)} documents have a pdf. {len(meta_messages)} documents do not have a pdf. "
+        )
+        if undelivered:
+            message += f"\n{len(undelivered)} documents could not be queued: {', '.join(undelivered)}"
+        logger.info(message)
+        send_email(message)
+
+    @classmethod
+    def _get_unprocessed_documents(cls, session) -> Iterator[Row]:
+        query = select(Document.id, Document.format, Document.attachment_link).filter(Document.processed.is_(False))
+        pages = keyset_pages(session, query, Document.id, page_size=min(cls.DAY_PROCESSING_LIMIT, cls.TASK_PAGE_SIZE))
+        return islice(chain.from_iterable(pages), cls.DAY_PROCESSING_LIMIT)
@@ -0,0 +1,63 @@
+from collections import OrderedDict
+from typing import Optional
+
+import fitz
+
+from infrastructure import metrics
+
+
+class TextFitter:
+    """Finds the largest font size, in FONT_SIZE_STEP steps below a starting size, at which a text fits a rect.
+
+    Sizes are probed by binary search on a scratch page that is never written, results are cached per
+    (text hash, rect size, font, starting size, line height) and `attempts` counts the layout attempts made.
+    """
+
+    FONT_SIZE_STEP = 0.1
+    MAX_CACHE_SIZE = 4096
+
+    def __init__(self):
+        self._scratch_document = fitz.open()
+        # the shape is never committed, so probing leaves no trace on the scratch page
+        self._scratch_shape = self._scratch_document.new_page().new_shape()
+        self._cache: OrderedDict = OrderedDict()
+        self.attempts = 0
+
+    def fit(
+        self, rect, text: str, max_font_size: float, fontname: str = "helv", lineheight: Optional[float] = None
+    ) -> Optional[float]:
+        """Return the font size to use, or None when the text does not fit even at the smallest size."""
+        rect = fitz.Rect(rect)
+        key = (hash(text), round(rect.width, 2), round(rect.height, 2), fontname, max_font_size, lineheight)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            metrics.add("text_fitter", cache_hits=1)
+            return self._cache[key]
+
+        probe_rect = fitz.Rect(0, 0, rect.width, rect.height)
+        # candidate sizes are max_font_size - step * n, as with a linear search going down from max_font_size
+        low, high = 0, int((max_font_size - 1e-9) / self.FONT_SIZE_STEP)
+        font_size = None
+        attempts = self.attempts
+        while low <= high:
+            step_count = (low + high) // 2
+            candidate = max_font_size - step_count * self.FONT_SIZE_STEP
+            if self._fits(probe_rect, text, candidate, fontname, lineheight):
+                font_size = candidate
+                high = step_count - 1
+            else:
+                low = step_count + 1
+
+        metrics.add("text_fitter", layout_attempts=self.attempts - attempts)
+        self._cache[key] = font_size
+        if len(self._cache) > self.MAX_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return font_size
+
+    def _fits(self, rect, text: str, font_size: float, fontname: str, lineheight: Optional[float]) -> bool:
+        self.attempts += 1
+        rc = self._scratch_shape.insert_textbox(
+            rect, text, fontsize=font_size, fontname=fontname, lineheight=lineheight
+        )
+        self._scratch_shape.text_cont = ""
+        return rc >= 0
@@ -0,0 +1,280 @@
+import logging
+import re
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, and_
+from sqlalchemy.dialects.postgresql import insert
+
+from infrastructure import metrics
+from infrastructure.aws import get_translation_service, translate_throttle
+from infrastructure.config import TRANSLATION_MEMORY_BACKEND, TRANSLATION_MEMORY_MAX_SIZE
+from infrastructure.db import Session
+from infrastructure.utils import normalized_text_hash
+from models.translation import TranslationMemoryEntry
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class TranslationService:
+    TARGET_LANGUAGE = "en"
+    AUTO_LANGUAGE = "auto"
+    FAILED_TRANSLATION = "Can't translate the text"
+    # AWS Translate accepts up to 10,000 bytes per request, keep some room for the separators.
+    MAX_REQUEST_BYTES = 9_000
+    SEPARATOR = "\n"
+    NEGATIVE_CACHE_FAILURES = 3
+    NEGATIVE_CACHE_TTL = 60 * 60
+    # Translate errors about the language itself, the only ones counted by the negative cache
+    LANGUAGE_ERRORS = ("UnsupportedLanguagePairException", "DetectedLanguageLowConfidenceException")
+
+    _memory: OrderedDict = OrderedDict()
+    _memory_lock = threading.Lock()
+    # source languages for which auto detection failed while the explicit language code worked
+    _skip_auto_detection: set = set()
+    # source language -> (consecutive failures, time of the last failure)
+    _failures: Dict[str, tuple] = {}
+    # guards _skip_auto_detection and _failures, which the page pipeline threads share
+    _language_lock = threading.Lock()
+
+    @classmethod
+    def translate(cls, text: str, source_language: str = AUTO_LANGUAGE, aws_translate=None) -> str:
+        return cls.translate_many([text], source_language, aws_translate)[0]
+
+    @classmethod
+    @metrics.timed("translate")
+    def translate_many(cls, texts: List[str], source_language: str = AUTO_LANGUAGE, aws_translate=None) -> List[str]:
+        """Translate texts to English, serving repeated texts from the translation memory and packing the rest
+        into as few Translate requests as possible."""
+        hashes = [normalized_text_hash(text) if text else "" for text in texts]
+        texts_by_hash = {text_hash: text for text_hash, text in zip(hashes, texts) if text_hash}
+        translations = cls._recall(source_language, list(texts_by_hash))
+
+        missed = {text_hash: text for text_hash, text in texts_by_hash.items() if text_hash not in translations}
+        if missed:
+            if not aws_translate:
+                aws_translate = get_translation_service()
+            translated_items = {}
+            for chunk in cls._coalesce(list(missed.items())):
+                translated_items.update(cls._translate_chunk(chunk, source_language, aws_translate))
+            new_translations = cls._join_parts(translated_items)
+            cls._remember(source_language, new_translations)
+            translations.update(new_translations)
+
+        return [
+            translations.get(text_hash, cls.FAILED_TRANSLATION) if text else text
+            for text, text_hash in zip(texts, hashes)
+        ]
+
+    @classmethod
+    def _coalesce(cls, items: List[tuple]) -> List[List[tuple]]:
+        separator_size = len(cls.SEPARATOR.encode())
+        chunks = []
+        chunk: List[tuple] = []
+        chunk_size = 0
+        for text_hash, text in items:
+            if len(text.encode()) > cls.MAX_REQUEST_BYTES:
+                # too large for one request, its parts are translated one per request and joined again
+                parts = cls._split(text)
+                chunks.extend([((text_hash, index, len(parts)), part)] for index, part in enumerate(parts))
+                continue
+            if cls.SEPARATOR in text:
+                # such a text could not be split back out of a joined translation, so it is sent on its own
+                chunks.append([(text_hash, text)])
+                continue
+            text_size = len(text.encode()) + separator_size
+            if chunk and chunk_size + text_size > cls.MAX_REQUEST_BYTES:
+                chunks.append(chunk)
+                chunk = []
+                chunk_size = 0
+            chunk.append((text_hash, text))
+            chunk_size += text_size
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    @classmethod
+    def _split(cls, text: str) -> List[str]:
+        """Split a text into parts of at most MAX_REQUEST_BYTES, at sentence ends where possible, else between words."""
+        parts: List[str] = []
+        part = ""
+        for sentence in re.split(r"(?<=[.!?\n])", text):
+            pieces = [sentence]
+            if len(sentence.encode()) > cls.MAX_REQUEST_BYTES:
+                # a UTF-8 character takes at most 4 bytes, so a quarter of the limit in characters always fits
+                max_chars = cls.MAX_REQUEST_BYTES // 4
+                pieces = [
+                    piece
+                    for word in re.findall(r"\s*\S+\s*", sentence)
+                    for piece in re.findall(f".{{1,{max_chars}}}", word, re.DOTALL)
+                ]
+            for piece in pieces:
+                if part and len((part + piece).encode()) > cls.MAX_REQUEST_BYTES:
+                    parts.append(part)
+                    part = ""
+                part += piece
+        if part:
+            parts.append(part)
+        return parts
+
+    @staticmethod
+    def _join_parts(translated_items: dict) -> Dict[str, str]:
+        """Gather the translations of split texts, keyed by (text hash, part index, part count), back into whole
+        translations. A text with a part missing is left out, as a failed translation."""
+        res = {}
+        parts: Dict[str, dict] = {}
+        for key, translated in translated_items.items():
+            if isinstance(key, tuple):
+                text_hash, index, part_count = key
+                parts.setdefault(text_hash, {})[index] = translated
+                if len(parts[text_hash]) == part_count:
+                    res[text_hash] = " ".join(parts[text_hash][i].strip() for i in range(part_count))
+            else:
+                res[key] = translated
+        return res
+
+    @classmethod
+    def _translate_chunk(cls, chunk: List[tuple], source_language: str, aws_translate) -> Dict[str, str]:
+        translated = cls._request_translation(
+            cls.SEPARATOR.join(text for _, text in chunk), source_language, aws_translate
+        )
+        if translated is None:
+            return {}
+        if len(chunk) == 1:
+            return {chunk[0][0]: translated}
+        parts = translated.split(cls.SEPARATOR)
+        if len(parts) == len(chunk):
+            return {text_hash: part.strip() for (text_hash, _), part in zip(chunk, parts)}
+
+        logger.info(f"Can't split a coalesced translation of {len(chunk)} texts, translating them one by one")
+        res = {}
+        for text_hash, text in chunk:
+            translated = cls._request_translation(text, source_language, aws_translate)
+            if translated is not None:
+                res[text_hash] = translated
+        return res
+
+    @classmethod
+    def _request_translation(cls, text: str, source_language: str, aws_translate) -> Optional[str]:
+        if cls._is_failing(source_language):
+            return None
+
+        source_codes = [cls.AUTO_LANGUAGE, source_language]
+        with cls._language_lock:
+            skip_auto_detection = source_language in cls._skip_auto_detection
+        if skip_auto_detection or source_language == cls.AUTO_LANGUAGE:
+            source_codes = [source_language]
+
+        language_failure = True
+        for source_code in source_codes:
+            try:
+                metrics.count("translate")
+                with translate_throttle:
+                    response = aws_translate.translate_text(
+                        Text=text,
+                        TerminologyNames=[],
+                        SourceLanguageCode=source_code,
+                        TargetLanguageCode=cls.TARGET_LANGUAGE,
+                        Settings={
+                            "Formality": "FORMAL",
+                            # "Profanity": "MASK"
+                        },
+                    )
+            except Exception as error:
+                logger.info(f"Translation from {source_code} failed: {traceback.format_exc()}")
+                # size limits, throttling or outages say nothing about the language
+                # not every botocore error has a response, ReadTimeoutError has None
+                error_code = (getattr(error, "response", None) or {}).get("Error", {}).get("Code")
+                language_failure = language_failure and error_code in cls.LANGUAGE_ERRORS
+                continue
+            with cls._language_lock:
+                if source_code != cls.AUTO_LANGUAGE:
+                    cls._skip_auto_detection.add(source_language)
+                cls._failures.pop(source_language, None)
+            return response.get("TranslatedText", "")
+
+        if language_failure:
+            with cls._language_lock:
+                failures, _ = cls._failures.get(source_language, (0, 0.0))
+                cls._failures[source_language] = (failures + 1, time.monotonic())
+        return None
+
+    @classmethod
+    def _is_failing(cls, source_language: str) -> bool:
+        with cls._language_lock:
+            failures, last_failure = cls._failures.get(source_language, (0, 0.0))
+            if failures < cls.NEGATIVE_CACHE_FAILURES:
+                return False
+            if time.monotonic() - last_failure > cls.NEGATIVE_CACHE_TTL:
+                cls._failures.pop(source_language, None)
+                return False
+            return True
+
+    @classmethod
+    def _recall(cls, source_language: str, text_hashes: List[str]) -> Dict[str, str]:
+        res = {}
+        with cls._memory_lock:
+            for text_hash in text_hashes:
+                translated = cls._memory.get((source_language, text_hash))
+                if translated is not None:
+                    cls._memory.move_to_end((source_language, text_hash))
+                    res[text_hash] = translated
+
+        missed = [text_hash for text_hash in text_hashes if text_hash not in res]
+        if missed and TRANSLATION_MEMORY_BACKEND == "postgres":
+            try:
+                with Session.session_factory() as session:
+                    rows = session.execute(
+                        select(TranslationMemoryEntry.text_hash, TranslationMemoryEntry.translated_text).filter(
+                            and_(
+                                TranslationMemoryEntry.source_language == source_language,
+                                TranslationMemoryEntry.text_hash.in_(missed),
+                            )
+                        )
+                    )
+                    stored = {text_hash: translated for text_hash, translated in rows}
+            except Exception:
+                logger.error(traceback.format_exc())
+                stored = {}
+            cls._remember_in_process(source_language, stored)
+            res.update(stored)
+        return res
+
+    @classmethod
+    def _remember(cls, source_language: str, translations: Dict[str, str]) -> None:
+        if not translations:
+            return
+        cls._remember_in_process(source_language, translations)
+        if TRANSLATION_MEMORY_BACKEND == "postgres":
+            now = datetime.now(tz=timezone.utc)
+            stmt = insert(TranslationMemoryEntry).values(
+                [
+                    dict(
+                        source_language=source_language,
+                        text_hash=text_hash,
+                        translated_text=translated,
+                        date_created=now,
+                    )
+                    for text_hash, translated in translations.items()
+                ]
+            )
+            try:
+                with Session.session_factory() as session:
+                    session.execute(stmt.on_conflict_do_nothing())
+                    session.commit()
+            except Exception:
+                logger.error(traceback.format_exc())
+
+    @classmethod
+    def _remember_in_process(cls, source_language: str, translations: Dict[str, str]) -> None:
+        with cls._memory_lock:
+            for text_hash, translated in translations.items():
+                cls._memory[(source_language, text_hash)] = translated
+                cls._memory.move_to_end((source_language, text_hash))
+            while len(cls._memory) > TRANSLATION_MEMORY_MAX_SIZE:
+                cls._memory.popitem(last=False)
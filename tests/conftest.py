@@ -0,0 +1,38 @@
+"""Shared fixtures. Tests needing Postgres are skipped unless TEST_RDS_CONNECTION_URL points to a scratch database,
+in the RDS_CONNECTION_URL format, whose tables are wiped by every test using it.
+
+Run from the repository root: python -m pytest tests
+"""
+import os
+
+import pytest
+
+if os.environ.get("TEST_RDS_CONNECTION_URL"):
+    # the engine is created from the configuration on import, so this must come first
+    os.environ["RDS_CONNECTION_URL"] = os.environ["TEST_RDS_CONNECTION_URL"]
+
+
+@pytest.fixture
+def db_session():
+    if not os.environ.get("TEST_RDS_CONNECTION_URL"):
+        pytest.skip("TEST_RDS_CONNECTION_URL is not set")
+
+    from sqlalchemy import text
+
+    import models.classification_cache  # noqa: F401
+    import models.country  # noqa: F401
+    import models.document  # noqa: F401
+    import models.scraper_watermark  # noqa: F401
+    import models.translation  # noqa: F401
+    from infrastructure.db import Base, Session, engine
+
+    Base.metadata.create_all(engine)
+    tables = ", ".join(f'"{table.name}"' for table in Base.metadata.sorted_tables)
+    with engine.begin() as connection:
+        connection.execute(text(f"TRUNCATE {tables} CASCADE"))
+    session = Session()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        Session.remove()
@@ -0,0 +1,41 @@
+import types
+
+import requests
+
+from models.document import Document
+from services.air_table_service import AirTableService
+
+
+def document(doc_id: int) -> Document:
+    return Document(id=doc_id, iso3="bgd", source_name="OCHA", format="Report", iso3_multiple=["bgd"], failed=False)
+
+
+class StubAirTable:
+    """Creates the posted records, except for batches holding `failing_id`, which raise a connection error."""
+
+    def __init__(self, failing_id: int):
+        self.failing_id = failing_id
+        self.created_ids = []
+
+    def post(self, url, json, **kwargs):
+        record_ids = [record["fields"]["RecordID"] for record in json["records"]]
+        if self.failing_id in record_ids:
+            raise requests.ConnectionError("connection reset")
+        self.created_ids.extend(record_ids)
+        return types.SimpleNamespace(status_code=200)
+
+
+def test_a_failed_batch_leaves_the_other_batches_synchronized(monkeypatch):
+    air_table = StubAirTable(failing_id=11)
+    monkeypatch.setattr(AirTableService, "_write_http", staticmethod(lambda: air_table))
+
+    synced_ids = AirTableService.sync_documents([document(doc_id) for doc_id in range(1, 31)])
+
+    assert sorted(synced_ids) == sorted(air_table.created_ids) == list(range(1, 11)) + list(range(21, 31))
+
+
+def test_record_creation_is_not_retried_once_airtable_may_have_created_the_records():
+    retry = AirTableService._write_http().get_adapter("https://api.airtable.com").max_retries
+
+    assert list(retry.status_forcelist) == [429]
+    assert retry.read == 0
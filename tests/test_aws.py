@@ -0,0 +1,71 @@
+import pytest
+
+from infrastructure import aws
+
+
+class StubSQS:
+    """Fails the messages in `failures` the first `attempts` times they are sent, with the given sender fault."""
+
+    def __init__(self, failures: dict, attempts: int = 1):
+        self.failures = failures
+        self.attempts = attempts
+        self.sent = {}
+        self.batches = []
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self.batches.append([entry["MessageBody"] for entry in Entries])
+        failed = []
+        for entry in Entries:
+            message = entry["MessageBody"]
+            self.sent[message] = self.sent.get(message, 0) + 1
+            if message in self.failures and self.sent[message] <= self.attempts:
+                failed.append({"Id": entry["Id"], "SenderFault": self.failures[message], "Code": "Error"})
+        return {"Failed": failed} if failed else {"Successful": []}
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(aws.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def test_send_batch_retries_only_the_failed_entries(monkeypatch, sleeps):
+    sqs = StubSQS({"message 3": False, "message 12": False})
+    monkeypatch.setattr(aws, "get_sqs", lambda: sqs)
+    messages = [f"message {ind}" for ind in range(15)]
+
+    assert aws.send_batch_to_sqs("topic", messages) == []
+    assert sqs.batches == [messages[:10], ["message 3"], messages[10:], ["message 12"]]
+    assert sleeps == [aws.SQS_RETRY_BACKOFF, aws.SQS_RETRY_BACKOFF]
+
+
+def test_send_batch_does_not_retry_sender_faults(monkeypatch, sleeps):
+    sqs = StubSQS({"malformed": True, "throttled": False})
+    monkeypatch.setattr(aws, "get_sqs", lambda: sqs)
+
+    assert aws.send_batch_to_sqs("topic", ["ok", "malformed", "throttled"]) == ["malformed"]
+    assert sqs.batches == [["ok", "malformed", "throttled"], ["throttled"]]
+
+
+def test_send_batch_returns_entries_still_failing_after_every_attempt(monkeypatch, sleeps):
+    sqs = StubSQS({"throttled": False}, attempts=aws.SQS_SEND_ATTEMPTS)
+    monkeypatch.setattr(aws, "get_sqs", lambda: sqs)
+
+    assert aws.send_batch_to_sqs("topic", ["ok", "throttled"]) == ["throttled"]
+    assert sqs.sent == {"ok": 1, "throttled": aws.SQS_SEND_ATTEMPTS}
+    assert sleeps == [aws.SQS_RETRY_BACKOFF * 2**attempt for attempt in range(aws.SQS_SEND_ATTEMPTS - 1)]
+
+
+def test_process_sqs_batch_reports_only_the_failed_records():
+    completed = []
+
+    def handler(record):
+        if record["body"] == "broken":
+            raise ValueError("cannot process")
+        completed.append(record["messageId"])
+
+    event = {"Records": [{"messageId": f"id-{ind}", "body": body} for ind, body in enumerate(["a", "broken", "b"])]}
+
+    assert aws.process_sqs_batch(event, handler, max_workers=2) == {"batchItemFailures": [{"itemIdentifier": "id-1"}]}
+    assert sorted(completed) == ["id-0", "id-2"]
@@ -0,0 +1,44 @@
+import pytest
+
+from infrastructure import aws
+from infrastructure.classification_cache import MemoryClassificationCache
+from infrastructure.classifier import FakeClassifier
+
+
+class CachedFakeClassifier(FakeClassifier):
+    CACHEABLE = True
+
+
+class BrokenCache(MemoryClassificationCache):
+    def _get_many(self, keys):
+        raise ConnectionError("cache is down")
+
+    def _set_many(self, scores):
+        raise ConnectionError("cache is down")
+
+
+@pytest.fixture
+def classifier(monkeypatch):
+    classifier = CachedFakeClassifier()
+    monkeypatch.setattr("infrastructure.classifier._classifier", classifier)
+    return classifier
+
+
+def test_cache_errors_are_misses(classifier, monkeypatch):
+    monkeypatch.setattr(aws, "get_classification_cache", BrokenCache)
+    texts = ["Roads to the camp are closed.", "Prices of food doubled."]
+
+    scores = aws.predict_scores_batch(texts)
+
+    assert scores == [[classifier.scores(model_name, [text])[0] for model_name in aws.MODELS] for text in texts]
+
+
+def test_cached_scores_are_served_without_the_classifier(classifier, monkeypatch):
+    cache = MemoryClassificationCache()
+    monkeypatch.setattr(aws, "get_classification_cache", lambda: cache)
+    texts = ["Roads to the camp are closed."]
+    first = aws.predict_scores_batch(texts)
+
+    monkeypatch.setattr(classifier, "scores", lambda model_name, texts: pytest.fail("classifier called"))
+
+    assert aws.predict_scores_batch(texts) == first
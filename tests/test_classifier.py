@@ -0,0 +1,89 @@
+import io
+import os
+import tarfile
+
+import pytest
+
+from infrastructure import classifier
+from infrastructure.aws import MODELS
+from infrastructure.classifier import LocalClassifier
+
+
+@pytest.fixture
+def temp_dir(tmp_path, monkeypatch):
+    # models are extracted under the temporary directory
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path / "tmp"))
+    os.makedirs(tmp_path / "tmp")
+    return tmp_path
+
+
+def test_extract_rejects_members_outside_the_model_directory(temp_dir):
+    model_dir = temp_dir / "models"
+    model_dir.mkdir()
+    with tarfile.open(model_dir / MODELS[0], "w:gz") as tar:
+        member = tarfile.TarInfo("../../escaped.txt")
+        member.size = 2
+        tar.addfile(member, io.BytesIO(b"no"))
+
+    with pytest.raises(tarfile.OutsideDestinationError):
+        LocalClassifier(model_dir=str(model_dir))._extract(MODELS[0])
+    assert not (temp_dir / "escaped.txt").exists()
+
+
+def write_archive(archive_path) -> None:
+    with tarfile.open(archive_path, "w:gz") as tar:
+        member = tarfile.TarInfo("config.json")
+        member.size = 2
+        tar.addfile(member, io.BytesIO(b"{}"))
+
+
+class StubS3:
+    def __init__(self):
+        self.downloads = []
+
+    def download_file(self, bucket, key, filename):
+        self.downloads.append((bucket, key))
+        write_archive(filename)
+
+
+def test_extract_deletes_only_downloaded_archives(temp_dir, monkeypatch):
+    s3 = StubS3()
+    monkeypatch.setattr(classifier, "get_client", lambda service_name: s3)
+    monkeypatch.setattr(classifier, "CLASSIFIER_MODEL_S3_URI", "s3://models/sophia")
+    model_dir = temp_dir / "models"
+    model_dir.mkdir()
+    write_archive(model_dir / MODELS[1])
+    local_classifier = LocalClassifier(model_dir=str(model_dir))
+
+    for model_name in MODELS[:2]:
+        assert os.path.exists(os.path.join(local_classifier._extract(model_name), "config.json"))
+
+    assert s3.downloads == [("models", f"sophia/{MODELS[0]}")]
+    assert sorted(os.listdir(model_dir)) == [MODELS[1]]
+
+
+def test_local_classifier_scores_with_an_archived_model(temp_dir):
+    pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+
+    # a tiny randomly initialised model, packaged like the endpoint artifacts
+    model_path = temp_dir / "model"
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "flood", "access", "road", "closed", "."]
+    model_path.mkdir()
+    (model_path / "vocab.txt").write_text("\n".join(vocab))
+    transformers.BertTokenizer(str(model_path / "vocab.txt")).save_pretrained(model_path)
+    config = transformers.BertConfig(
+        vocab_size=len(vocab), hidden_size=8, num_hidden_layers=1, num_attention_heads=2, intermediate_size=16
+    )
+    transformers.BertForSequenceClassification(config).save_pretrained(model_path)
+    model_dir = temp_dir / "models"
+    model_dir.mkdir()
+    with tarfile.open(model_dir / MODELS[0], "w:gz") as tar:
+        tar.add(model_path, arcname=".")
+
+    classifier = LocalClassifier(model_dir=str(model_dir), threads=1)
+    scores = classifier.scores(MODELS[0], ["flood access road closed .", "road closed", "flood"])
+
+    assert len(scores) == 3
+    assert all(0.0 <= score <= 1.0 for score in scores)
+    assert classifier.scores(MODELS[0], ["road closed"]) == pytest.approx([scores[1]])
@@ -0,0 +1,21 @@
+import fitz
+
+from services.pdf_document_service import PDFDocumentService
+
+
+def test_stored_snippets_on_one_line_are_all_rendered():
+    pdf = fitz.open()
+    pdf.new_page()
+    snippets = [
+        ((50, 100, 500, 130), "Roads to the camp are closed.", ["tag_Access"]),
+        # starts and ends on the last line of the previous snippet
+        ((50, 118, 500, 130), "Aid is delayed.", ["tag_Access"]),
+        ((50, 118, 500, 160), "Prices of food doubled since the floods.", []),
+        ((50, 170, 50, 170), "", []),
+    ]
+
+    PDFDocumentService._render_stored_page(pdf, 1, snippets)
+
+    text = pdf[1].get_text()
+    assert all(snippet in text for _, snippet, _ in snippets)
+    assert text.count("#tag_Access_framework") == 2
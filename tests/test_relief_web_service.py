@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from models.document import Document
+from models.scraper_watermark import ScraperWatermark
+from services.relief_web_service import ReliefWebService
+
+
+def relief_web_doc(relief_web_id: int, title: str = "Flood update") -> dict:
+    return {
+        "id": str(relief_web_id),
+        "fields": {
+            "source": [{"name": "OCHA"}],
+            "format": [{"name": "Situation Report"}],
+            "date": {"created": "2023-08-01T10:00:00+00:00", "original": "2023-08-01T09:00:00+00:00"},
+            "origin": "https://example.org/report",
+            "body": "Water levels are rising.",
+            "url_alias": f"https://reliefweb.int/report/{relief_web_id}",
+            "file": [{"url": f"https://reliefweb.int/attachments/{relief_web_id}.pdf"}],
+            "language": [{"name": "English", "code": "en"}],
+            "country": [{"iso3": "bgd"}],
+            "disaster_type": [{"name": "Flood"}],
+            "disaster": [{"name": "Monsoon 2023", "glide": "FL-2023-000001-BGD"}],
+            "theme": [{"name": "Shelter"}],
+            "title": title,
+            "primary_country": {"iso3": "bgd"},
+        },
+    }
+
+
+def test_upsert_documents_counts_inserted_and_updated(db_session):
+    assert ReliefWebService._upsert_documents(db_session, [relief_web_doc(1), relief_web_doc(2)]) == (2, 0)
+    assert ReliefWebService._upsert_documents(db_session, [relief_web_doc(2), relief_web_doc(3)]) == (1, 1)
+    db_session.commit()
+
+    assert db_session.scalars(select(Document.relief_web_id).order_by(Document.relief_web_id)).all() == [1, 2, 3]
+
+
+def test_upsert_documents_keeps_the_last_of_duplicate_ids_in_a_batch(db_session):
+    docs = [relief_web_doc(1, "First title"), relief_web_doc(1, "Second title")]
+
+    assert ReliefWebService._upsert_documents(db_session, docs) == (1, 0)
+    db_session.commit()
+
+    assert db_session.scalars(select(Document.title)).all() == ["Second title"]
+
+
+def test_upsert_documents_leaves_processing_state_on_conflict(db_session):
+    ReliefWebService._upsert_documents(db_session, [relief_web_doc(1)])
+    db_session.commit()
+    doc = db_session.scalars(select(Document)).one()
+    doc.processed = True
+    doc.synchronized = True
+    db_session.commit()
+
+    assert ReliefWebService._upsert_documents(db_session, [relief_web_doc(1, "Revised title")]) == (0, 1)
+    db_session.commit()
+
+    db_session.expire_all()
+    doc = db_session.scalars(select(Document)).one()
+    assert (doc.title, doc.processed, doc.synchronized) == ("Revised title", True, True)
+
+
+def test_daily_scrape_resumes_from_an_old_watermark(db_session, monkeypatch):
+    requested = []
+    monkeypatch.setattr(
+        ReliefWebService, "_get_data", lambda date_from, date_to, countries: requested.append(date_from) or iter([])
+    )
+    last_created = datetime.now(tz=timezone.utc) - timedelta(days=4)
+    db_session.add(ScraperWatermark(name=ReliefWebService.DAILY_WATERMARK, last_created=last_created))
+    db_session.commit()
+    default_from = datetime.now(tz=timezone.utc) - timedelta(days=ReliefWebService.DEFAULT_RETRIEVED_DAYS)
+
+    ReliefWebService._scrape_range(db_session, ReliefWebService.DAILY_WATERMARK, default_from, None, ["bgd"])
+
+    assert requested == [last_created - ReliefWebService.WATERMARK_OVERLAP]
+
+
+def test_backfill_chunk_does_not_start_before_its_range(db_session, monkeypatch):
+    requested = []
+    monkeypatch.setattr(
+        ReliefWebService, "_get_data", lambda date_from, date_to, countries: requested.append(date_from) or iter([])
+    )
+    chunk_from = datetime(2023, 8, 10, tzinfo=timezone.utc)
+    db_session.add(ScraperWatermark(name="backfill", last_created=datetime(2023, 8, 1, tzinfo=timezone.utc)))
+    db_session.commit()
+
+    ReliefWebService._scrape_range(db_session, "backfill", chunk_from, chunk_from + timedelta(days=7), ["bgd"])
+
+    assert requested == [chunk_from]
@@ -0,0 +1,137 @@
+import threading
+from collections import OrderedDict
+
+import pytest
+from botocore.exceptions import ClientError, ReadTimeoutError
+
+from services import translation_service
+from services.translation_service import TranslationService
+
+
+class StubTranslate:
+    """Upper-cases texts, or raises what `fail` returns for a request."""
+
+    def __init__(self, fail=None):
+        self.fail = fail or (lambda text, source_code: None)
+        self.requests = []
+
+    def translate_text(self, Text, SourceLanguageCode, **kwargs):
+        self.requests.append((Text, SourceLanguageCode))
+        error = self.fail(Text, SourceLanguageCode)
+        if error:
+            raise error
+        return {"TranslatedText": Text.upper()}
+
+
+def client_error(code: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": code}}, "TranslateText")
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(translation_service, "TRANSLATION_MEMORY_BACKEND", "memory")
+    monkeypatch.setattr(TranslationService, "_memory", OrderedDict())
+    monkeypatch.setattr(TranslationService, "_skip_auto_detection", set())
+    monkeypatch.setattr(TranslationService, "_failures", {})
+    monkeypatch.setattr(TranslationService, "_language_lock", threading.Lock())
+
+
+def test_small_texts_are_coalesced_into_one_request():
+    client = StubTranslate()
+
+    assert TranslationService.translate_many(["un", "deux", "", "un"], "fr", client) == ["UN", "DEUX", "", "UN"]
+    assert len(client.requests) == 1
+
+
+def test_repeated_texts_come_from_the_memory():
+    client = StubTranslate()
+    TranslationService.translate_many(["un", "deux"], "fr", client)
+
+    assert TranslationService.translate_many(["deux", "un"], "fr", client) == ["DEUX", "UN"]
+    assert len(client.requests) == 1
+
+
+def test_coalesce_respects_the_request_size():
+    items = [(str(index), "x" * 1000) for index in range(20)]
+
+    chunks = TranslationService._coalesce(items)
+
+    assert [item for chunk in chunks for item in chunk] == items
+    assert all(
+        sum(len(text) + len(TranslationService.SEPARATOR) for _, text in chunk) <= TranslationService.MAX_REQUEST_BYTES
+        for chunk in chunks
+    )
+
+
+def test_a_misaligned_split_falls_back_to_one_request_per_text():
+    class MergingTranslate(StubTranslate):
+        def translate_text(self, Text, SourceLanguageCode, **kwargs):
+            response = super().translate_text(Text, SourceLanguageCode, **kwargs)
+            return {"TranslatedText": response["TranslatedText"].replace("\n", " ")}
+
+    client = MergingTranslate()
+
+    assert TranslationService.translate_many(["un", "deux"], "fr", client) == ["UN", "DEUX"]
+    assert [text for text, _ in client.requests] == ["un\ndeux", "un", "deux"]
+
+
+def test_split_keeps_every_character_within_the_size_limit():
+    text = "Une phrase assez longue. " * 800 + "x" * 20_000 + " fin."
+
+    parts = TranslationService._split(text)
+
+    assert "".join(parts) == text
+    assert all(len(part.encode()) <= TranslationService.MAX_REQUEST_BYTES for part in parts)
+
+
+def test_oversized_texts_are_translated_in_parts_and_joined():
+    text = "Bonjour le monde. " * 1000
+    client = StubTranslate(
+        lambda text, source_code: client_error("TextSizeLimitExceededException") if len(text) > 10_000 else None
+    )
+
+    translated = TranslationService.translate_many([text], "fr", client)[0]
+
+    assert translated.split() == text.upper().split()
+    assert len(client.requests) > 1
+
+
+def test_join_parts_leaves_out_texts_with_a_missing_part():
+    translated_items = {"whole": "WHOLE", ("split", 0, 2): "A ", ("split", 1, 2): " B", ("broken", 0, 2): "C"}
+
+    assert TranslationService._join_parts(translated_items) == {"whole": "WHOLE", "split": "A B"}
+
+
+def test_language_errors_disable_the_language():
+    client = StubTranslate(lambda text, source_code: client_error("UnsupportedLanguagePairException"))
+    for index in range(TranslationService.NEGATIVE_CACHE_FAILURES):
+        TranslationService.translate(f"texte {index}", "xx", client)
+    request_count = len(client.requests)
+
+    assert TranslationService.translate("encore", "xx", client) == TranslationService.FAILED_TRANSLATION
+    assert len(client.requests) == request_count
+
+
+@pytest.mark.parametrize(
+    "error",
+    [client_error("ThrottlingException"), ReadTimeoutError(endpoint_url="https://translate"), ConnectionError()],
+)
+def test_other_errors_do_not_disable_the_language(error):
+    failing = StubTranslate(lambda text, source_code: error)
+    for index in range(TranslationService.NEGATIVE_CACHE_FAILURES + 1):
+        assert TranslationService.translate(f"texte {index}", "fr", failing) == TranslationService.FAILED_TRANSLATION
+
+    assert TranslationService.translate("bonjour", "fr", StubTranslate()) == "BONJOUR"
+
+
+def test_auto_detection_is_skipped_once_the_explicit_code_worked():
+    client = StubTranslate(
+        lambda text, source_code: client_error("DetectedLanguageLowConfidenceException")
+        if source_code == "auto"
+        else None
+    )
+    TranslationService.translate("premier", "fr", client)
+    client.requests.clear()
+
+    assert TranslationService.translate("second", "fr", client) == "SECOND"
+    assert client.requests == [("second", "fr")]